@@ -0,0 +1,121 @@
+"""
+Benchmark of DataProcessor._data_cleaner against the previous groupby/set implementation on synthetic panels.
+
+Usage (from the repository root):
+    python Benchmark/cleaner_benchmark.py --sizes 100000 300000 1000000 --years 10
+"""
+import os
+import sys
+import time
+import argparse
+import tracemalloc
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from DataProcessor import DataProcessor
+
+STATES = ['AL', 'AK', 'AZ', 'AR', 'CA', 'CO', 'CT', 'DE', 'FL', 'GA', 'HI', 'ID', 'IL', 'IN', 'IA', 'KS', 'KY',
+          'LA', 'ME', 'MD', 'MA', 'MI', 'MN', 'MS', 'MO', 'MT', 'NE', 'NV', 'NH', 'NJ', 'NM', 'NY', 'NC', 'ND',
+          'OH', 'OK', 'OR', 'PA', 'RI', 'SC', 'SD', 'TN', 'TX', 'UT', 'VT', 'VA', 'WA', 'WV', 'WI', 'WY',
+          'DC', 'PR', 'GU', 'VI']
+
+
+def synthetic_panel(n_rows, n_years, start=2000, seed=0):
+    """
+    Generates a loaded (not yet cleaned) panel with about n_rows institution-years over n_years years.
+    About 80% of institutions appear in every year; the rest drop out at random, and 2% of enrollments are missing.
+    """
+    rng = np.random.default_rng(seed)
+    n_ids = max(1, n_rows // n_years)
+    ids = np.arange(100000, 100000 + n_ids, dtype=np.int32)
+    states = rng.choice(STATES, n_ids)
+    degree_bach = (rng.random(n_ids) < 0.7).astype(np.int64)
+    public = (rng.random(n_ids) < 0.4).astype(np.int64)
+    highest = rng.integers(1, 10, n_ids).astype(np.int8)
+    always = rng.random(n_ids) < 0.8
+
+    frames = []
+    for year in range(start, start + n_years):
+        present = always | (rng.random(n_ids) < 0.7)
+        n = int(present.sum())
+        enroll = rng.integers(0, 5000, n).astype(float)
+        enroll[rng.random(n) < 0.02] = np.nan
+        frames.append(pd.DataFrame({
+            'ID_IPEDS': ids[present],
+            'stabbr': states[present],
+            'highest_degree': highest[present],
+            'degree_bach': degree_bach[present],
+            'public': public[present],
+            'enroll_ftug': enroll,
+            'grant_federal': rng.gamma(2.0, 1e6, n),
+            'year': year
+        }))
+    return pd.concat(frames, ignore_index=True)
+
+
+def legacy_cleaner(processor, panel_data):
+    """
+    The previous _data_cleaner: copies after every step and builds a Python set of years per institution.
+    """
+    panel_data_clean = panel_data.copy()
+    if processor.undergraduate_institutions:
+        panel_data_clean = panel_data_clean[panel_data_clean['degree_bach'] == 1].copy()
+    exclude_list = processor._exclude_list()
+    panel_data_clean = panel_data_clean[~panel_data_clean['stabbr'].isin(exclude_list)].copy()
+    if processor.balanced_panel:
+        panel_data_clean = panel_data_clean.dropna().copy()
+        panel_data_clean['year'] = panel_data_clean['year'].astype(int)
+        expected_years = set(range(processor.start, processor.end + 1))
+        id_years = panel_data_clean.groupby('ID_IPEDS')['year'].apply(set)
+        complete_ids = id_years[id_years.apply(lambda x: x == expected_years)].index
+        panel_data_clean = panel_data_clean[panel_data_clean['ID_IPEDS'].isin(complete_ids)].copy()
+    return panel_data_clean
+
+
+def measure(func, repeat):
+    """
+    Returns the best wall time over repeat runs, the peak traced memory of one run and the result.
+    """
+    best = float('inf')
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        result = func()
+        best = min(best, time.perf_counter() - t0)
+    tracemalloc.start()
+    func()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return best, peak, result
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the vectorized DataProcessor cleaner.")
+    parser.add_argument('--sizes', type=int, nargs='+', default=[100000, 300000, 1000000],
+                        help="approximate numbers of institution-years")
+    parser.add_argument('--years', type=int, default=10, help="number of years in the panel")
+    parser.add_argument('--repeat', type=int, default=3, help="timed runs per implementation (best is reported)")
+    args = parser.parse_args()
+
+    start = 2000
+    processor = DataProcessor(
+        start=start,
+        end=start + args.years - 1,
+        balanced_panel=True,
+        excluding_states=['DC', 'PR', 'GU', 'VI'],
+        undergraduate_institutions=True
+    )
+
+    print(f"{'rows':>10} {'legacy s':>10} {'vector s':>10} {'speedup':>8} {'legacy MB':>10} {'vector MB':>10}")
+    for size in args.sizes:
+        panel = synthetic_panel(size, args.years, start=start)
+        t_old, m_old, old = measure(lambda: legacy_cleaner(processor, panel), args.repeat)
+        t_new, m_new, new = measure(lambda: processor._data_cleaner(panel), args.repeat)
+        if not old.equals(new):
+            raise AssertionError(f"Vectorized cleaner differs from the legacy cleaner at {size} rows")
+        print(f"{len(panel):>10,} {t_old:>10.3f} {t_new:>10.3f} {t_old / t_new:>7.1f}x "
+              f"{m_old / 2**20:>10.1f} {m_new / 2**20:>10.1f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,77 @@
+"""
+Benchmark of MapBatch against independent MapMaker._map_figure calls on synthetic state-level data.
+Reports the seconds per map of each, the share of the independent cost a batched map takes, and, with --n-jobs,
+the batch rendered across worker processes.
+
+Usage (from the repository root):
+    python Benchmark/map_batch_benchmark.py --maps 50 --independent 5
+    python Benchmark/map_batch_benchmark.py --maps 200 --n-jobs 4
+"""
+import os
+import sys
+import time
+import shutil
+import argparse
+import tempfile
+import matplotlib
+matplotlib.use('Agg')
+import numpy as np
+import pandas as pd
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_DIR)
+from MapMaker import MapMaker, STATE_LIST
+from MapBatch import MapBatch
+
+SHAPEFILE_PATH = os.path.join(REPO_DIR, 'cb_2018_us_state_20m', 'cb_2018_us_state_20m.shp')
+
+
+def synthetic_jobs(n_maps, seed=0):
+    """
+    Returns n_maps (data, col, export_name) jobs, each mapping a random grant per student for the 50 states.
+    """
+    rng = np.random.default_rng(seed)
+    return [(pd.DataFrame({'stabbr': STATE_LIST, 'grant': rng.gamma(4.0, 500.0, len(STATE_LIST))}), 'grant',
+             f'Benchmark Map {i:03d}') for i in range(n_maps)]
+
+
+def timed(func):
+    """
+    Returns the wall time of one call.
+    """
+    t0 = time.perf_counter()
+    func()
+    return time.perf_counter() - t0
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark batched map rendering against independent MapMaker calls.")
+    parser.add_argument('--maps', type=int, default=50, help="maps in the batch")
+    parser.add_argument('--independent', type=int, default=5, help="independent MapMaker calls timed (their mean is reported)")
+    parser.add_argument('--n-jobs', type=int, nargs='*', default=[], help="worker counts to also time the batch with")
+    parser.add_argument('--file-format', default='png', help="'png', 'svg' or 'pdf'")
+    args = parser.parse_args()
+
+    jobs = synthetic_jobs(args.maps)
+    output_dir = tempfile.mkdtemp(prefix="map_benchmark_")
+    try:
+        # The base layer is built once before timing, so both sides measure rendering
+        MapMaker(None, None, None, shapefile_path=SHAPEFILE_PATH)._base_layer()
+        independent = np.mean([
+            timed(MapMaker(data, col, export_name, shapefile_path=SHAPEFILE_PATH, file_format=args.file_format,
+                           output_dir=output_dir)._map_figure)
+            for data, col, export_name in jobs[:args.independent]
+        ])
+        print(f"{'renderer':>22} {'maps':>6} {'s/map':>8} {'share':>7}")
+        print(f"{'MapMaker (independent)':>22} {args.independent:>6} {independent:>8.3f} {1:>7.0%}")
+        for n_jobs in [1, *args.n_jobs]:
+            batch = MapBatch(jobs, n_jobs=n_jobs, shapefile_path=SHAPEFILE_PATH, file_format=args.file_format,
+                             output_dir=output_dir)
+            per_map = timed(batch._render) / len(jobs)
+            print(f"{f'MapBatch (n_jobs={n_jobs})':>22} {len(jobs):>6} {per_map:>8.3f} {per_map / independent:>7.0%}")
+    finally:
+        shutil.rmtree(output_dir, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    main()
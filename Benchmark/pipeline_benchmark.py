@@ -0,0 +1,186 @@
+"""
+End-to-end benchmark of the processing, analysis and mapping stages on synthetic IPEDS data of several sizes.
+Each stage reports its best wall time, throughput and peak traced memory; results are compared with a stored
+baseline and stages that got slower or use more memory than the tolerance allows are flagged as regressions.
+
+Usage (from the repository root):
+    python Benchmark/pipeline_benchmark.py --institutions 2000 7000 20000 --save-baseline
+    python Benchmark/pipeline_benchmark.py --institutions 2000 7000 20000
+"""
+import io
+import os
+import sys
+import json
+import time
+import shutil
+import platform
+import argparse
+import contextlib
+import tempfile
+import tracemalloc
+import matplotlib
+matplotlib.use('Agg')
+import pandas as pd
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_DIR)
+from DataProcessor import DataProcessor
+from DataAnalyzer import DataAnalyzer
+from MapMaker import MapMaker
+from synthetic_ipeds import generate
+
+BASELINE_PATH = os.path.join(REPO_DIR, "Benchmark", "baseline.json")
+EXCLUDING_STATES = ['DC', 'FM', 'MH', 'MP', 'PR', 'PW', 'VI', 'GU', 'AS']
+# Formula grid of the sweep benchmark: 10 linear x 10 quadratic coefficients
+SWEEP_FORMULAS = [[a, b] for a in range(1000, 3000, 200) for b in [0.05 * i for i in range(1, 11)]]
+# Slowdowns smaller than this many seconds are timer noise and never flagged
+NOISE_SECONDS = 0.005
+
+
+def measure(func, repeat):
+    """
+    Returns the best wall time over repeat runs, the peak traced memory of one run and the result.
+    The progress messages printed by the stages are discarded.
+    """
+    best = float('inf')
+    with contextlib.redirect_stdout(io.StringIO()):
+        for _ in range(repeat):
+            t0 = time.perf_counter()
+            result = func()
+            best = min(best, time.perf_counter() - t0)
+        tracemalloc.start()
+        func()
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+    return best, peak, result
+
+
+def run_size(root, institutions, start, end, repeat, maps):
+    """
+    Generates the raw files for one size under root and benchmarks every stage from the root directory.
+    Returns one record per stage with rows in and out, wall time, throughput and peak memory.
+    """
+    counts = generate(root, institutions=institutions, start=start, end=end)
+    os.makedirs(os.path.join(root, 'Figure'), exist_ok=True)
+    year = end
+    processor = DataProcessor(start, end, True, EXCLUDING_STATES, True, use_cache=False)
+    shapefile_path = os.path.join(REPO_DIR, 'cb_2018_us_state_20m', 'cb_2018_us_state_20m.shp')
+
+    with contextlib.redirect_stdout(io.StringIO()):
+        raw = processor._data_loader()
+    clean = processor._data_cleaner(raw)
+    state_data = DataAnalyzer(clean, year, None)._aggregate_per_student_grant()
+    # Analyzers are created inside the timed calls, since they cache their aggregates
+    stages = [
+        ('data_loader', counts['hd'] + counts['sfa'], processor._data_loader),
+        ('data_cleaner', len(raw), lambda: processor._data_cleaner(raw)),
+        ('data_exporter', len(clean), lambda: processor._data_exporter(clean, binary=True, output_dir=root)),
+        ('aggregate_per_student_grant', len(clean),
+         lambda: DataAnalyzer(clean, year, None)._aggregate_per_student_grant()),
+        ('summary_statistics', len(state_data),
+         lambda: DataAnalyzer(None, None, None)._summary_statistics(state_data, 'per_student_federal_grant')),
+        ('simulater', len(clean), lambda: DataAnalyzer(clean, year, [1750, 0.15])._simulater()),
+        ('simulater_sweep', len(clean), lambda: DataAnalyzer(clean, year, None)._simulater_sweep(SWEEP_FORMULAS))
+    ]
+    if maps:
+        # The base layer is built once before timing, so the map benchmark measures rendering
+        map_maker = MapMaker(state_data, 'per_student_federal_grant', 'Benchmark Map', shapefile_path=shapefile_path)
+        map_maker._base_layer()
+        stages.append(('map_figure', len(state_data), map_maker._map_figure))
+
+    records = []
+    for name, rows_in, func in stages:
+        seconds, peak, result = measure(func, repeat)
+        records.append({
+            'stage': name,
+            'institutions': institutions,
+            'rows_in': int(rows_in),
+            'rows_out': int(len(result)) if isinstance(result, (pd.DataFrame, pd.Series)) else None,
+            'seconds': seconds,
+            'rows_per_second': rows_in / seconds if seconds > 0 else None,
+            'peak_mb': peak / 2**20
+        })
+    return records
+
+
+def compare(records, baseline, tolerance):
+    """
+    Flags the stages whose wall time or peak memory exceeds the baseline by more than the tolerance.
+    Returns the records with 'time_ratio', 'memory_ratio' and 'regression' added.
+    """
+    previous = {(r['stage'], r['institutions']): r for r in baseline.get('records', [])}
+    for record in records:
+        base = previous.get((record['stage'], record['institutions']))
+        record['time_ratio'] = record['seconds'] / base['seconds'] if base and base['seconds'] > 0 else None
+        record['memory_ratio'] = record['peak_mb'] / base['peak_mb'] if base and base['peak_mb'] > 0 else None
+        slower = record['time_ratio'] is not None and record['time_ratio'] > 1 + tolerance \
+            and record['seconds'] - base['seconds'] > NOISE_SECONDS
+        larger = record['memory_ratio'] is not None and record['memory_ratio'] > 1 + tolerance
+        record['regression'] = slower or larger
+    return records
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the pipeline stages on synthetic IPEDS data.")
+    parser.add_argument('--institutions', type=int, nargs='+', default=[2000, 7000, 20000],
+                        help="institutions per year of each benchmarked size")
+    parser.add_argument('--start', type=int, default=2010, help="first academic year")
+    parser.add_argument('--end', type=int, default=2015, help="last academic year")
+    parser.add_argument('--repeat', type=int, default=3, help="timed runs per stage (best is reported)")
+    parser.add_argument('--no-maps', action='store_true', help="skip the map benchmark")
+    parser.add_argument('--baseline', default=BASELINE_PATH, help="baseline file to compare with or save to")
+    parser.add_argument('--save-baseline', action='store_true', help="store the results as the new baseline")
+    parser.add_argument('--tolerance', type=float, default=0.25,
+                        help="allowed relative increase of time or memory before a stage is flagged")
+    parser.add_argument('--work-dir', default=None, help="directory for the synthetic data (a temporary one by default)")
+    args = parser.parse_args()
+
+    work_dir = args.work_dir or tempfile.mkdtemp(prefix="ipeds_benchmark_")
+    cwd = os.getcwd()
+    records = []
+    try:
+        for institutions in args.institutions:
+            root = os.path.join(os.path.abspath(work_dir), f"n{institutions}")
+            os.makedirs(root, exist_ok=True)
+            # DataProcessor, DataSchema and MapMaker resolve their folders from the working directory
+            os.chdir(root)
+            try:
+                records.extend(run_size(root, institutions, args.start, args.end, args.repeat, not args.no_maps))
+            finally:
+                os.chdir(cwd)
+    finally:
+        if args.work_dir is None:
+            shutil.rmtree(work_dir, ignore_errors=True)
+
+    baseline = {}
+    if os.path.exists(args.baseline):
+        with open(args.baseline, encoding='utf-8') as f:
+            baseline = json.load(f)
+    records = compare(records, baseline, args.tolerance)
+
+    print(f"{'stage':<28} {'inst':>7} {'rows in':>10} {'seconds':>9} {'rows/s':>12} {'peak MB':>9} {'vs base':>8}")
+    for r in records:
+        ratio = f"{r['time_ratio']:.2f}x" if r['time_ratio'] is not None else '-'
+        flag = '  REGRESSION' if r['regression'] else ''
+        throughput = f"{r['rows_per_second']:,.0f}" if r['rows_per_second'] else '-'
+        print(f"{r['stage']:<28} {r['institutions']:>7,} {r['rows_in']:>10,} {r['seconds']:>9.4f} "
+              f"{throughput:>12} {r['peak_mb']:>9.1f} {ratio:>8}{flag}")
+
+    if args.save_baseline:
+        machine = {'platform': platform.platform(), 'python': platform.python_version(), 'pandas': pd.__version__}
+        with open(args.baseline, 'w', encoding='utf-8') as f:
+            json.dump({'machine': machine, 'records': [{k: r[k] for k in ['stage', 'institutions', 'rows_in', 'rows_out',
+                                                                            'seconds', 'rows_per_second', 'peak_mb']}
+                                                         for r in records]}, f, indent=1)
+        print(f"Baseline saved to {args.baseline}")
+    elif baseline.get('machine', {}).get('platform') not in (None, platform.platform()):
+        print("Warning: the baseline was recorded on a different machine; ratios may not be comparable.")
+
+    regressions = [r for r in records if r['regression']]
+    if regressions and not args.save_baseline:
+        print(f"{len(regressions)} stage(s) regressed by more than {args.tolerance:.0%}.")
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,124 @@
+"""
+Load test of the local analysis service (Service.py): sends a mix of grant, simulation and summary queries from
+concurrent clients and reports latency percentiles, throughput and the cache hit rate per endpoint.
+
+Usage (from the repository root):
+    python Benchmark/service_load_test.py --clean-data clean_data --requests 2000 --concurrency 8
+    python Benchmark/service_load_test.py --url http://127.0.0.1:8000   (against a service that is already running)
+"""
+import os
+import sys
+import json
+import time
+import argparse
+import subprocess
+import urllib.request
+from urllib.parse import urlencode
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+STATES = ['AL', 'AZ', 'CA', 'CO', 'FL', 'GA', 'IL', 'MA', 'MI', 'NC', 'NJ', 'NY', 'OH', 'PA', 'TX', 'VA', 'VT', 'WA']
+
+
+def fetch(url):
+    """
+    Sends one GET request and returns the latency in seconds, the HTTP status and the X-Cache header.
+    """
+    t0 = time.perf_counter()
+    try:
+        with urllib.request.urlopen(url, timeout=60) as response:
+            response.read()
+            status, cache_state = response.status, response.headers.get('X-Cache')
+    except urllib.error.HTTPError as e:
+        status, cache_state = e.code, None
+    return time.perf_counter() - t0, status, cache_state
+
+
+def request_mix(base_url, years, n_requests, n_formulas, maps, seed):
+    """
+    Draws the (endpoint, url) pairs of the test. Formulas come from a grid of n_formulas, so repeated queries hit the cache
+    about as often as dashboards asking the same questions would.
+    """
+    rng = np.random.default_rng(seed)
+    formulas = [(1000 + 250 * (i % 8), round(0.05 * (1 + i // 8), 2)) for i in range(n_formulas)]
+    endpoints = ['/grants', '/simulate', '/summary'] + (['/map'] if maps else [])
+    weights = np.array([0.4, 0.3, 0.3] + ([0.02] if maps else []))
+    requests = []
+    for endpoint in rng.choice(endpoints, n_requests, p=weights / weights.sum()):
+        year = int(rng.choice(years))
+        a, b = formulas[rng.integers(len(formulas))]
+        if endpoint == '/grants':
+            params = {'year': year, 'states': ','.join(rng.choice(STATES, 2, replace=False))}
+        elif endpoint == '/simulate':
+            params = {'year': year, 'a': a, 'b': b}
+        else:
+            kind = str(rng.choice(['actual', 'simulated']))
+            params = {'year': year, 'kind': kind, **({'a': a, 'b': b} if kind == 'simulated' else {})}
+        requests.append((endpoint, f"{base_url}{endpoint}?{urlencode(params)}"))
+    return requests
+
+
+def wait_for(base_url, timeout=120):
+    """
+    Waits until the service answers /health and returns its response.
+    """
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        try:
+            with urllib.request.urlopen(f"{base_url}/health", timeout=5) as response:
+                return json.loads(response.read())
+        except OSError:
+            time.sleep(0.2)
+    raise RuntimeError(f"The service at {base_url} did not start within {timeout} s.")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Load-test the local analysis service.")
+    parser.add_argument('--url', default=None, help="base URL of a running service (by default one is started)")
+    parser.add_argument('--clean-data', default=os.path.join(REPO_DIR, 'clean_data'),
+                        help="panel served by the service started for the test")
+    parser.add_argument('--port', type=int, default=8765, help="port of the service started for the test")
+    parser.add_argument('--requests', type=int, default=2000, help="number of requests")
+    parser.add_argument('--concurrency', type=int, default=8, help="concurrent clients")
+    parser.add_argument('--formulas', type=int, default=32, help="distinct simulation formulas in the mix")
+    parser.add_argument('--maps', action='store_true', help="include map requests (about 2% of the mix)")
+    parser.add_argument('--seed', type=int, default=0, help="random seed of the request mix")
+    args = parser.parse_args()
+
+    server = None
+    base_url = args.url
+    if base_url is None:
+        base_url = f"http://127.0.0.1:{args.port}"
+        server = subprocess.Popen([sys.executable, os.path.join(REPO_DIR, 'Service.py'), '--clean-data', args.clean_data,
+                                   '--port', str(args.port)], cwd=REPO_DIR, stdout=subprocess.DEVNULL)
+    try:
+        health = wait_for(base_url)
+        requests = request_mix(base_url, health['years'], args.requests, args.formulas, args.maps, args.seed)
+
+        t0 = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=args.concurrency) as pool:
+            results = list(pool.map(lambda request: fetch(request[1]), requests))
+        elapsed = time.perf_counter() - t0
+    finally:
+        if server is not None:
+            server.terminate()
+            server.wait()
+
+    print(f"{len(requests):,} requests in {elapsed:.2f} s ({len(requests) / elapsed:,.0f} requests/s), "
+          f"concurrency {args.concurrency}")
+    print(f"{'endpoint':<10} {'n':>6} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} {'max ms':>8} {'miss p50':>9} {'hit rate':>9} {'errors':>7}")
+    for endpoint in sorted({endpoint for endpoint, _ in requests}):
+        rows = [result for (e, _), result in zip(requests, results) if e == endpoint]
+        latency = np.array([r[0] for r in rows]) * 1e3
+        misses = np.array([r[0] for r in rows if r[2] == 'miss']) * 1e3
+        hits = sum(r[2] == 'hit' for r in rows)
+        errors = sum(r[1] != 200 for r in rows)
+        p50, p95, p99 = np.percentile(latency, [50, 95, 99])
+        miss_p50 = f"{np.median(misses):.1f}" if len(misses) else '-'
+        print(f"{endpoint:<10} {len(rows):>6,} {p50:>8.1f} {p95:>8.1f} {p99:>8.1f} {latency.max():>8.1f} "
+              f"{miss_p50:>9} {hits / len(rows):>9.1%} {errors:>7}")
+
+
+if __name__ == '__main__':
+    main()
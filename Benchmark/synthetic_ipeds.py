@@ -0,0 +1,133 @@
+"""
+Generator of synthetic IPEDS raw data with the layout DataProcessor reads: Raw Data/HD{year}/hd{year}.csv and
+Raw Data/SFA{yy}{yy}/sfa{yy}{yy}.csv for each academic year, padded with filler variables to realistic file widths.
+
+Usage:
+    python Benchmark/synthetic_ipeds.py --root /tmp/ipeds --institutions 7000 --start 2010 --end 2015
+    (then run DataProcessor from /tmp/ipeds)
+"""
+import os
+import sys
+import shutil
+import argparse
+import numpy as np
+import pandas as pd
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_DIR)
+from DataProcessor import DataProcessor
+
+STATES = ['AL', 'AK', 'AZ', 'AR', 'CA', 'CO', 'CT', 'DE', 'FL', 'GA', 'HI', 'ID', 'IL', 'IN', 'IA', 'KS', 'KY',
+          'LA', 'ME', 'MD', 'MA', 'MI', 'MN', 'MS', 'MO', 'MT', 'NE', 'NV', 'NH', 'NJ', 'NM', 'NY', 'NC', 'ND',
+          'OH', 'OK', 'OR', 'PA', 'RI', 'SC', 'SD', 'TN', 'TX', 'UT', 'VT', 'VA', 'WA', 'WV', 'WI', 'WY',
+          'DC', 'PR', 'GU', 'VI', 'AS', 'FM', 'MH', 'MP', 'PW']
+# Actual HD2011 files have 66 variables and SFA files about 400
+HD_WIDTH = 66
+SFA_WIDTH = 400
+
+
+def _filler(rng, n, k, missing_rate, text):
+    """
+    Generates filler variable k: quoted text for every fourth variable of HD files, otherwise integer codes and counts.
+    Missing values are left blank, as in the IPEDS files.
+    """
+    if text and k % 4 == 0:
+        values = pd.Series(rng.integers(0, 10**6, n)).map(lambda v: f"Synthetic value {v}")
+    else:
+        values = pd.Series(rng.integers(-2, [10, 100, 10**4, 10**6][k % 4], n), dtype='Int64')
+    return values.mask(rng.random(n) < missing_rate)
+
+
+def generate(root, institutions=7000, start=2010, end=2015, hd_width=HD_WIDTH, sfa_width=SFA_WIDTH,
+             missing_rate=0.02, churn=0.03, seed=0):
+    """
+    Writes synthetic HD and SFA files for the academic years start to end into root/Raw Data, and copies the
+    variable dictionaries of the repository so that the files are parsed with the same dtypes.
+    Returns the number of raw rows written per file kind, e.g. {'hd': 42000, 'sfa': 41000}.
+
+    root: directory the data is written to (the working directory DataProcessor is run from)
+    institutions: number of institutions in each year
+    start: first academic year
+    end: last academic year
+    hd_width: number of variables in the HD files (at least the variables used in the panel)
+    sfa_width: number of variables in the SFA files
+    missing_rate: share of missing values of enrollment, grants and filler variables
+    churn: share of institutions replaced by new ones from one year to the next (closures and openings)
+    seed: random seed
+    """
+    rng = np.random.default_rng(seed)
+    raw_dir = os.path.join(root, "Raw Data")
+    dictionary_dir = os.path.join(REPO_DIR, "Raw Data", "Dictionary")
+    target_dir = os.path.join(raw_dir, "Dictionary")
+    # With root the repository itself, the dictionaries are already in place
+    if os.path.isdir(dictionary_dir) and not (os.path.isdir(target_dir) and os.path.samefile(dictionary_dir, target_dir)):
+        shutil.copytree(dictionary_dir, target_dir, dirs_exist_ok=True)
+
+    # Step 1: Draw time-invariant institution characteristics
+    n_total = institutions + int(churn * institutions) * (end - start)
+    ids = np.sort(rng.choice(np.arange(100000, 100000 + 10 * n_total), n_total, replace=False)).astype(np.int64)
+    states = rng.choice(STATES, n_total)
+    control = rng.choice([1, 2, 3], n_total, p=[0.35, 0.45, 0.2])
+    hloffer = rng.choice([-3, 1, 2, 3, 4, 5, 6, 7, 8, 9], n_total)
+    ugoffer = rng.choice([1, 2], n_total, p=[0.85, 0.15])
+    size = rng.lognormal(7, 1.2, n_total)
+
+    counts = {'hd': 0, 'sfa': 0}
+    processor = DataProcessor(start, end, True, [], True)
+    for i, year in enumerate(range(start, end + 1)):
+        # Step 2: Institutions active this year, shifted by the yearly churn; a few HD rows have no SFA record
+        lo = i * int(churn * institutions)
+        active = np.arange(lo, lo + institutions)
+        n = len(active)
+        hd = pd.DataFrame({
+            'UNITID': ids[active],
+            'INSTNM': [f"Synthetic Institution {unitid}" for unitid in ids[active]],
+            'STABBR': states[active],
+            'CONTROL': control[active],
+            'HLOFFER': hloffer[active],
+            'UGOFFER': ugoffer[active]
+        })
+        for k in range(hd_width - hd.shape[1]):
+            hd[f"HDVAR{k:03d}"] = _filler(rng, n, k, missing_rate, text=True)
+
+        in_sfa = active[rng.random(n) > 0.01]
+        m = len(in_sfa)
+        enroll = np.round(size[in_sfa] * rng.lognormal(0, 0.1, m))
+        grant = np.round(enroll * rng.gamma(2.0, 1000, m))
+        sfa = pd.DataFrame({
+            'UNITID': ids[in_sfa],
+            'SCUGFFN': pd.Series(enroll, dtype='Int64').mask(rng.random(m) < missing_rate),
+            'FGRNT_T': pd.Series(grant, dtype='Int64').mask(rng.random(m) < missing_rate)
+        })
+        for k in range(sfa_width - sfa.shape[1]):
+            sfa[f"SFAVAR{k:03d}"] = _filler(rng, m, k, missing_rate, text=False)
+
+        # Step 3: Write the pair under the folder names of the academic year
+        for folder, df in zip(processor._year_folders(year + 1), [hd, sfa]):
+            folder_dir = os.path.join(raw_dir, folder)
+            os.makedirs(folder_dir, exist_ok=True)
+            df.to_csv(os.path.join(folder_dir, folder.lower() + ".csv"), index=False)
+            counts['hd' if folder.startswith("HD") else 'sfa'] += len(df)
+    return counts
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Write synthetic IPEDS HD and SFA raw files.")
+    parser.add_argument('--root', required=True, help="directory to write 'Raw Data' into")
+    parser.add_argument('--institutions', type=int, default=7000, help="institutions per year")
+    parser.add_argument('--start', type=int, default=2010, help="first academic year")
+    parser.add_argument('--end', type=int, default=2015, help="last academic year")
+    parser.add_argument('--hd-width', type=int, default=HD_WIDTH, help="variables per HD file")
+    parser.add_argument('--sfa-width', type=int, default=SFA_WIDTH, help="variables per SFA file")
+    parser.add_argument('--missing-rate', type=float, default=0.02, help="share of missing values")
+    parser.add_argument('--churn', type=float, default=0.03, help="yearly share of institutions replaced")
+    parser.add_argument('--seed', type=int, default=0, help="random seed")
+    args = parser.parse_args()
+
+    counts = generate(args.root, args.institutions, args.start, args.end, args.hd_width, args.sfa_width,
+                      args.missing_rate, args.churn, args.seed)
+    print(f"Wrote {counts['hd']:,} HD rows and {counts['sfa']:,} SFA rows to {os.path.join(args.root, 'Raw Data')}")
+
+
+if __name__ == '__main__':
+    main()
@@ -1,69 +1,134 @@
+import numpy as np
+import pandas as pd
+from concurrent.futures import ProcessPoolExecutor
+from Tracer import Tracer, traced
+from PanelIndex import PanelIndex
+from Rollup import Rollup, ROLLUP_LEVELS, STATISTICS, STATE_REGION, NATIONAL
+from PanelRegression import PanelRegression
+
+def _bootstrap_chunk(grant, enroll, bounds, seed, n_replicates):
+    """
+    Computes n_replicates bootstrap replicates of the per-student grant of every state, resampling institutions within states.
+    Returns an array of shape (n_replicates, n_states).
+
+    grant: federal grants of the institutions, sorted by state
+    enroll: enrollments of the institutions, in the same order
+    bounds: positions where each state's block of institutions starts, plus the total number of institutions
+    seed: SeedSequence of this chunk, so that results do not depend on how chunks are spread across processes
+    n_replicates: number of replicates in this chunk
+    """
+    rng = np.random.default_rng(seed)
+    sizes = np.diff(bounds)
+    starts = np.repeat(bounds[:-1], sizes)
+    # Resampling index matrix: every position draws an institution of its own state
+    index = starts + (rng.random((n_replicates, len(starts))) * np.repeat(sizes, sizes)).astype(np.int64)
+    grant_sums = np.add.reduceat(grant[index], bounds[:-1], axis=1)
+    enroll_sums = np.add.reduceat(enroll[index], bounds[:-1], axis=1)
+    return np.divide(grant_sums, enroll_sums, out=np.zeros_like(grant_sums), where=enroll_sums > 0)
+
 class DataAnalyzer():
-    def __init__(self, clean_data, year, formula):
+    def __init__(self, clean_data, year, formula, tracer=None):
         """
-        clean_data: clean panel data
+        clean_data: clean panel data, as a DataFrame or a PanelIndex (whose year slices replace the year mask scans)
         year: the specific year to analyze
         formula: a list of two numeric values representing the coefficients for the simulation formula—
         the first for the linear term and the second for the quadratic term
+        tracer: Tracer recording the time, memory and rows in/out of each method (None for no tracing)
         """
         self.clean_data = clean_data
         self.year = year
         self.formula = formula
+        self._cube = None
+        self._moments = {}
+        self.tracer = tracer or Tracer()
+
+
+    def _panel_frame(self):
+        """
+        Returns the clean panel as a DataFrame.
+        """
+        return self.clean_data.data if isinstance(self.clean_data, PanelIndex) else self.clean_data
+
+    def _year_data(self):
+        """
+        Returns the rows of the specified year: a slice of a PanelIndex, otherwise a boolean mask scan of the panel.
+        """
+        if isinstance(self.clean_data, PanelIndex):
+            return self.clean_data._year(self.year)
+        return self.clean_data[self.clean_data['year'] == self.year]
+
+    def _safe_divide(self, numerator, denominator):
+        """
+        Divides element-wise, returning 0 where the denominator is not positive (or missing).
+        """
+        numerator = np.asarray(numerator, dtype='float64')
+        denominator = np.asarray(denominator, dtype='float64')
+        return np.divide(numerator, denominator, out=np.zeros_like(numerator), where=denominator > 0)
 
+    @traced('aggregate_cube', rows_in=lambda self, *args: self.clean_data)
+    def _aggregate_cube(self):
+        """
+        Aggregates federal grant and enrollment for every (year, state) pair in one grouped pass and computes per-student grants.
+        Returns a DataFrame indexed by (year, stabbr); e.g. cube['per_student_federal_grant'].unstack('stabbr') is the year x state matrix.
+        The cube is computed once per analyzer and reused by _aggregate_per_student_grant.
+        """
+        if self._cube is None:
+            cube = self._panel_frame().groupby(['year', 'stabbr'], observed=True).agg({
+                'grant_federal': 'sum',
+                'enroll_ftug': 'sum'
+            })
+            cube['per_student_federal_grant'] = self._safe_divide(cube['grant_federal'], cube['enroll_ftug'])
+            self._cube = cube
+        return self._cube
 
+    @traced('aggregate_per_student_grant', rows_in=lambda self, *args: self.clean_data)
     def _aggregate_per_student_grant(self):
         """
         Aggregates federal grant and enrollment by state, computing per-student grants for the specified year.
         """
-        # Step 1: Filter data for the specified year
-        data_year = self.clean_data[self.clean_data['year'] == self.year].copy()
-
-        # Step 2: Group by 'stabbr' and sum 'grant_federal' and 'enroll_ftug'
-        grouped = data_year.groupby('stabbr').agg({
-            'grant_federal': 'sum',
-            'enroll_ftug': 'sum'
-        }).reset_index()
+        # Step 1: Slice the specified year out of the (year, state) cube
+        cube = self._aggregate_cube()
+        grouped = cube[cube.index.get_level_values('year') == self.year].droplevel('year').reset_index()
 
-        # Step 3: Calculate per-student federal grant, avoid division by zero
-        grouped['per_student_federal_grant'] = grouped.apply(
-            lambda row: row['grant_federal'] / row['enroll_ftug'] if row['enroll_ftug'] > 0 else 0,
-            axis=1
-        )
+        # Step 2: Label the result with the year
         grouped['year'] = self.year
 
         return grouped
 
+    @traced('summary_statistics', rows_in=lambda self, data, col: data)
     def _summary_statistics(self, data, col):
         """
         Computes descriptive and region-level statistics for per-student federal grants.
+        Both levels come from one Rollup of the data, which is not modified.
 
         data: a DataFrame with 'stabbr', 'per_student_federal_grant', and 'year'
         col: the specific column name of the data to summary
         """
+        table = Rollup(data, [col])._table(levels=['national', 'region'])
 
         # National descriptive stats
-        desc_stats = data[col].describe(percentiles=[0.25, 0.5, 0.75]).to_frame().T
-        desc_stats['variance'] = data[col].var()
-
-        # Census region mapping
-        census_regions = {
-            'Northeast': ['ME', 'NH', 'VT', 'MA', 'RI', 'CT', 'NY', 'NJ', 'PA'],
-            'Midwest': ['OH', 'IN', 'IL', 'MI', 'WI', 'MN', 'IA', 'MO', 'ND', 'SD', 'NE', 'KS'],
-            'South': ['DE', 'MD', 'VA', 'WV', 'NC', 'SC', 'GA', 'FL', 'KY', 'TN', 'MS', 'AL', 'OK', 'TX', 'AR', 'LA'],
-            'West': ['WA', 'OR', 'CA', 'NV', 'ID', 'MT', 'WY', 'CO', 'NM', 'AZ', 'UT', 'AK', 'HI']
-        }
-        state_to_region = {}
-        for region, states in census_regions.items():
-            for state in states:
-                state_to_region[state] = region
-        data['census_region'] = data['stabbr'].map(state_to_region)
+        desc_stats = table[table['level'] == 'national'][STATISTICS].set_axis([col])
 
         # Region-level stats
-        region_stats = data.groupby('census_region')[col].agg(['mean', 'var']).reset_index()
+        region_stats = table[table['level'] == 'region'][['group', 'mean', 'variance']]
+        region_stats = region_stats.set_axis(['census_region', 'mean', 'var'], axis=1).reset_index(drop=True)
 
         return desc_stats, region_stats
 
+    @traced('rollup_statistics', rows_in=lambda self, data, cols, *args, **kwargs: data)
+    def _rollup_statistics(self, data, cols, levels=ROLLUP_LEVELS):
+        """
+        Computes the statistics of several columns at the national, Census region, Census division and state levels in one pass.
+        Returns one row per (level, group, column); see Rollup._table.
+
+        data: a DataFrame with 'stabbr' and the columns to summarize, e.g. simulated grants under several formulas
+        cols: list of columns to summarize
+        levels: levels to include, among 'national', 'region', 'division' and 'state'
+        """
+        return Rollup(data, cols)._table(levels)
+
         
+    @traced('simulater', rows_in=lambda self, *args: self.clean_data)
     def _simulater(self):
         """
         Simulates per-student federal grants using a quadratic formula at the school level
@@ -72,25 +137,151 @@ class DataAnalyzer():
         a, b = self.formula
 
         # Step 2: Filter by specified year
-        df = self.clean_data[self.clean_data['year'] == self.year].copy()
+        df = self._year_data().copy()
 
-        # Step 3: Compute simulated federal grants for each school
+        # Step 3: Compute simulated federal grants for each school (in float, as compact int32 enrollment would overflow when squared)
+        enroll = df['enroll_ftug'].astype('float64')
         df['grant_federal_simulated'] = (
-            a * df['enroll_ftug'] +
-            b * (df['enroll_ftug'] ** 2)
+            a * enroll +
+            b * (enroll ** 2)
         )
 
         # Step 4: Group by state and sum enrollments and simulated grants
-        state_grouped = df.groupby('stabbr').agg({
+        state_grouped = df.groupby('stabbr', observed=True).agg({
             'enroll_ftug': 'sum',
             'grant_federal_simulated': 'sum'
         }).reset_index()
 
         # Step 5: Compute per-student simulated grants
-        state_grouped['grant_per_student_simulated'] = state_grouped.apply(
-            lambda row: row['grant_federal_simulated'] / row['enroll_ftug'] if row['enroll_ftug'] > 0 else 0,
-            axis=1
+        state_grouped['grant_per_student_simulated'] = self._safe_divide(
+            state_grouped['grant_federal_simulated'], state_grouped['enroll_ftug']
         )
         state_grouped['year'] = self.year
 
         return state_grouped[['year', 'stabbr', 'grant_per_student_simulated']]
+
+    @traced('sufficient_statistics', rows_in=lambda self, *args: self.clean_data)
+    def _sufficient_statistics(self):
+        """
+        Computes, per state in the specified year, the sums of enrollment and of squared enrollment.
+        Any quadratic formula [a, b] gives per-student grant (a * sum_enroll + b * sum_enroll_sq) / sum_enroll from these two sums.
+        """
+        if self.year not in self._moments:
+            # Step 1: Filter by specified year
+            df = self._year_data()
+
+            # Step 2: Sum enrollment and squared enrollment by state, in float to avoid integer overflow
+            enroll = df['enroll_ftug'].astype('float64')
+            self._moments[self.year] = pd.DataFrame({
+                'stabbr': df['stabbr'],
+                'enroll_sum': enroll,
+                'enroll_sq_sum': enroll ** 2
+            }).groupby('stabbr', observed=True).sum()
+        return self._moments[self.year]
+
+    @traced('simulater_sweep', rows_in=lambda self, *args: self.clean_data)
+    def _simulater_sweep(self, formulas):
+        """
+        Simulates per-student federal grants for many quadratic formulas at once.
+        The per-state sums are computed once; each formula then costs O(states) through NumPy broadcasting.
+        Returns the simulated per-student grants (one row per formula, one column per state) and,
+        for each formula, the same descriptive statistics across states as _summary_statistics.
+
+        formulas: array-like of shape (n, 2), each row holding the linear and quadratic coefficients [a, b]
+        """
+        # Step 1: Arrange coefficients as column vectors
+        formulas = np.asarray(formulas, dtype='float64').reshape(-1, 2)
+        a = formulas[:, [0]]
+        b = formulas[:, [1]]
+
+        # Step 2: Score every formula for every state
+        moments = self._sufficient_statistics()
+        enroll_sum = moments['enroll_sum'].to_numpy()
+        enroll_sq_sum = moments['enroll_sq_sum'].to_numpy()
+        granted = a * enroll_sum + b * enroll_sq_sum
+        simulated = self._safe_divide(granted, np.broadcast_to(enroll_sum, granted.shape))
+        simulated = pd.DataFrame(simulated, columns=moments.index.astype(str))
+        simulated.columns.name = 'stabbr'
+
+        # Step 3: Summarize across states for every formula
+        values = simulated.to_numpy()
+        n_states = values.shape[1]
+        summary = pd.DataFrame({'a': formulas[:, 0], 'b': formulas[:, 1], 'count': float(n_states)})
+        if n_states:
+            quartiles = np.quantile(values, [0.25, 0.5, 0.75], axis=1)
+            summary['mean'] = values.mean(axis=1)
+            summary['std'] = values.std(axis=1, ddof=1) if n_states > 1 else np.nan
+            summary['min'] = values.min(axis=1)
+            summary['25%'] = quartiles[0]
+            summary['50%'] = quartiles[1]
+            summary['75%'] = quartiles[2]
+            summary['max'] = values.max(axis=1)
+            summary['variance'] = summary['std'] ** 2
+
+        return simulated, summary
+
+    @traced('bootstrap', rows_in=lambda self, *args, **kwargs: self._year_data())
+    def _bootstrap(self, n_replicates=1000, confidence=0.95, seed=0, n_jobs=1, chunk_size=None):
+        """
+        Bootstraps confidence intervals of the per-student federal grant of each state in the specified year, and of the national
+        and regional mean and variance of these state values (the statistics of _summary_statistics), by resampling institutions
+        within states. Replicates are computed in chunks from a resampling index matrix, as batched sums per state.
+        Returns one row per (level, group, statistic) with the point estimate, the bootstrap standard error and the percentile interval.
+
+        n_replicates: number of bootstrap replicates
+        confidence: coverage of the percentile intervals
+        seed: random seed; each chunk gets its own seed derived from it, so results are the same for any n_jobs
+        n_jobs: number of worker processes the chunks are spread across (1 computes them in this process)
+        chunk_size: replicates per chunk (by default about 2 million resampled institutions per chunk)
+        """
+        # Step 1: Sort the institutions of the year by state, so that each state is a contiguous block
+        df = self._year_data()
+        states, codes = np.unique(df['stabbr'].astype(str).to_numpy(), return_inverse=True)
+        order = np.argsort(codes, kind='stable')
+        grant = df['grant_federal'].to_numpy(dtype='float64', na_value=0)[order]
+        enroll = df['enroll_ftug'].to_numpy(dtype='float64', na_value=0)[order]
+        bounds = np.searchsorted(codes[order], np.arange(len(states) + 1))
+
+        # Step 2: Compute the replicates chunk by chunk, serially or in a process pool
+        chunk_size = chunk_size or max(1, 2_000_000 // max(len(grant), 1))
+        sizes = [min(chunk_size, n_replicates - lo) for lo in range(0, n_replicates, chunk_size)]
+        seeds = np.random.SeedSequence(seed).spawn(len(sizes))
+        args = [[grant] * len(sizes), [enroll] * len(sizes), [bounds] * len(sizes), seeds, sizes]
+        if n_jobs > 1 and len(sizes) > 1:
+            with ProcessPoolExecutor(max_workers=min(n_jobs, len(sizes))) as pool:
+                replicates = np.vstack(list(pool.map(_bootstrap_chunk, *args)))
+        else:
+            replicates = np.vstack(list(map(_bootstrap_chunk, *args)))
+
+        # Step 3: Point estimates and replicates of the state values and of their national and regional mean and variance
+        estimate = self._safe_divide(np.add.reduceat(grant, bounds[:-1]), np.add.reduceat(enroll, bounds[:-1]))
+        rows = [('state', state, 'per_student_federal_grant', estimate[s], replicates[:, s]) for s, state in enumerate(states)]
+        regions = np.array([STATE_REGION.get(state) for state in states], dtype=object)
+        groups = [('national', NATIONAL, np.ones(len(states), dtype=bool))]
+        groups += [('region', region, regions == region) for region in sorted(set(regions) - {None})]
+        for level, group, members in groups:
+            rows.append((level, group, 'mean', estimate[members].mean(), replicates[:, members].mean(axis=1)))
+            if members.sum() > 1:
+                rows.append((level, group, 'var', estimate[members].var(ddof=1), replicates[:, members].var(axis=1, ddof=1)))
+            else:
+                rows.append((level, group, 'var', np.nan, np.full(n_replicates, np.nan)))
+
+        # Step 4: Standard errors and percentile intervals
+        alpha = (1 - confidence) / 2
+        table = pd.DataFrame([(level, group, statistic, point) for level, group, statistic, point, _ in rows],
+                             columns=['level', 'group', 'statistic', 'estimate'])
+        draws = np.array([draws for *_, draws in rows])
+        table['std_error'] = draws.std(axis=1, ddof=1) if n_replicates > 1 else np.nan
+        table['lower'], table['upper'] = np.quantile(draws, [alpha, 1 - alpha], axis=1)
+        return table
+
+    def _fixed_effects(self, y='grant_federal', x=('enroll_ftug',), cluster='stabbr'):
+        """
+        Regresses y on x over all years of the clean panel with institution and year fixed effects, clustering the
+        standard errors by state (see PanelRegression). Returns the coefficient table and a dict of fit statistics.
+
+        y: dependent variable
+        x: regressors
+        cluster: column the standard errors are clustered by (None for heteroskedasticity-robust standard errors)
+        """
+        return PanelRegression(self._panel_frame(), y, x, cluster=cluster, tracer=self.tracer)._fit()
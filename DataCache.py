@@ -0,0 +1,146 @@
+import os
+import json
+import hashlib
+import pandas as pd
+
+try:
+    import pyarrow  # noqa: F401  (Parquet engine)
+    HAS_PARQUET = True
+except ImportError:
+    HAS_PARQUET = False
+
+class DataCache():
+    def __init__(self, cache_dir=os.path.join("Cache", "raw")):
+        """
+        cache_dir: folder holding one Parquet file (plus a small JSON manifest) per parsed raw CSV file
+        """
+        self.cache_dir = cache_dir
+        self.enabled = HAS_PARQUET
+
+    def _entry_paths(self, csv_path):
+        """
+        Returns the Parquet and manifest paths of the cache entry for a source file, named after its absolute path.
+        """
+        source = os.path.abspath(csv_path)
+        name = os.path.splitext(os.path.basename(source))[0]
+        digest = hashlib.sha1(source.encode('utf-8')).hexdigest()[:12]
+        stem = os.path.join(self.cache_dir, f"{name}_{digest}")
+        return stem + ".parquet", stem + ".json"
+
+    def _content_hash(self, csv_path):
+        """
+        Hashes the raw file contents in 1 MB blocks.
+        """
+        h = hashlib.sha256()
+        with open(csv_path, 'rb') as f:
+            for block in iter(lambda: f.read(1 << 20), b''):
+                h.update(block)
+        return h.hexdigest()
+
+    def _source_hash(self, csv_path):
+        """
+        Returns the content hash of a source file without reading it when its cache entry records the same size and
+        modification time, as _load does. Otherwise the file is hashed once and the hash is recorded, so the next call
+        skips hashing: in a new entry without data, or, when the contents match the entry, under the new timestamp.
+        An entry whose data no longer matches the file is left for _load to reject and _store to replace.
+
+        csv_path: path to the raw CSV file
+        """
+        data_path, meta_path = self._entry_paths(csv_path)
+        stat = os.stat(csv_path)
+        meta = None
+        if os.path.exists(meta_path):
+            try:
+                with open(meta_path, encoding='utf-8') as f:
+                    meta = json.load(f)
+            except (OSError, ValueError):
+                meta = None
+        if meta is not None and meta.get('size') == stat.st_size and meta.get('mtime') == stat.st_mtime and meta.get('sha256'):
+            return meta['sha256']
+
+        sha256 = self._content_hash(csv_path)
+        has_data = meta is not None and os.path.exists(data_path)
+        if not has_data or meta.get('sha256') == sha256:
+            meta = dict(meta or {}, source=os.path.abspath(csv_path), size=stat.st_size, mtime=stat.st_mtime, sha256=sha256)
+            try:
+                os.makedirs(self.cache_dir, exist_ok=True)
+                self._write_json(meta_path, meta)
+            except OSError:
+                pass
+        return sha256
+
+    def _load(self, csv_path, columns, dtypes):
+        """
+        Returns the cached frame for a source file, or None if there is no valid entry.
+        An entry is valid when the projected columns and dtypes match and the file has the same size and either the same
+        modification time or, if it was touched or copied, the same content hash.
+
+        csv_path: path to the raw CSV file
+        columns: list of raw variable names that were parsed
+        dtypes: dtype map the columns were parsed with
+        """
+        if not self.enabled:
+            return None
+        data_path, meta_path = self._entry_paths(csv_path)
+        if not (os.path.exists(data_path) and os.path.exists(meta_path)):
+            return None
+        try:
+            with open(meta_path, encoding='utf-8') as f:
+                meta = json.load(f)
+        except (OSError, ValueError):
+            return None
+
+        stat = os.stat(csv_path)
+        if meta.get('columns') != list(columns) or meta.get('dtypes') != dtypes or meta.get('size') != stat.st_size:
+            return None
+        if meta.get('mtime') != stat.st_mtime:
+            if meta.get('sha256') != self._content_hash(csv_path):
+                return None
+            # Same contents under a new timestamp: refresh the manifest so the next run skips hashing
+            meta['mtime'] = stat.st_mtime
+            self._write_json(meta_path, meta)
+
+        try:
+            return pd.read_parquet(data_path)
+        except Exception:
+            return None
+
+    def _store(self, csv_path, columns, dtypes, df):
+        """
+        Writes a parsed frame to the cache, replacing the previous entry for the same source file.
+
+        csv_path: path to the raw CSV file
+        columns: list of raw variable names that were parsed
+        dtypes: dtype map the columns were parsed with
+        df: the parsed frame
+        """
+        if not self.enabled:
+            return
+        data_path, meta_path = self._entry_paths(csv_path)
+        stat = os.stat(csv_path)
+        meta = {
+            'source': os.path.abspath(csv_path),
+            'size': stat.st_size,
+            'mtime': stat.st_mtime,
+            'sha256': self._content_hash(csv_path),
+            'columns': list(columns),
+            'dtypes': dtypes
+        }
+        try:
+            os.makedirs(self.cache_dir, exist_ok=True)
+            # Write to a temporary file first so that a concurrent reader never sees a partial entry
+            tmp_path = f"{data_path}.{os.getpid()}.tmp"
+            df.to_parquet(tmp_path, index=False)
+            os.replace(tmp_path, data_path)
+            self._write_json(meta_path, meta)
+        except Exception as e:
+            print(f"Warning: could not cache {csv_path}: {e}")
+
+    def _write_json(self, path, obj):
+        """
+        Atomically writes a JSON manifest.
+        """
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(obj, f)
+        os.replace(tmp_path, path)
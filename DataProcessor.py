@@ -1,145 +1,519 @@
 import os
+import numpy as np
 import pandas as pd
 import sys
+from concurrent.futures import ProcessPoolExecutor
+from DataSchema import DataSchema
+from DataCache import DataCache
+from PanelFile import PanelFile
+from Tracer import Tracer, traced
+
+# Raw IPEDS variables kept from each file, and their names in the panel
+HD_COLUMNS = ['UNITID', 'STABBR', 'HLOFFER', 'UGOFFER', 'CONTROL']
+SFA_COLUMNS = ['UNITID', 'SCUGFFN', 'FGRNT_T']
+RENAME_COLUMNS = {
+    'UNITID': 'ID_IPEDS',
+    'STABBR': 'stabbr',
+    'HLOFFER': 'highest_degree',
+    'UGOFFER': 'degree_bach',
+    'CONTROL': 'public',
+    'SCUGFFN': 'enroll_ftug',
+    'FGRNT_T': 'grant_federal'
+}
+# Panel columns recoded to 0/1
+BINARY_COLUMNS = ['degree_bach', 'public']
+
+def _load_year_traced(processor, year):
+    """
+    Loads one folder year in a worker process and returns the result with the spans the worker recorded.
+    """
+    return processor._load_year(year), processor.tracer._detach()
 
 class DataProcessor():
-    def __init__(self, start, end, balanced_panel, excluding_states, undergraduate_institutions):
+    def __init__(self, start, end, balanced_panel, excluding_states, undergraduate_institutions, n_jobs=1, use_cache=True, chunksize=100000,
+                 tracer=None):
         """
         start: start year of the panel (inclusive)
         end: end year of the panel (inclusive)
         balanced_panel: whether to construct a balanced panel 
         excluding_states: list of state abbreviations to exclude
         undergraduate_institutions: whether to restric sample into institutions that offer bachelor's degree
+        n_jobs: number of worker processes used to load the yearly files in parallel (1 loads them serially)
+        use_cache: whether to reuse parsed raw files from the on-disk Parquet cache (requires pyarrow)
+        chunksize: number of raw rows read at a time by the streaming methods (_data_streamer, _stream_exporter)
+        tracer: Tracer recording the time, memory and rows in/out of each loading and cleaning step (None for no tracing)
         """
         self.start = start
         self.end = end
         self.balanced_panel = balanced_panel
         self.excluding_states = excluding_states
         self.undergraduate_institutions = undergraduate_institutions
+        self.n_jobs = n_jobs
+        self.use_cache = use_cache
+        self.chunksize = chunksize
+        self.schema = DataSchema()
+        self.cache = DataCache()
+        self.tracer = tracer or Tracer()
+
+    def _year_folders(self, year):
+        """
+        Returns the (HD, SFA) raw data folder names for a folder year (the calendar year in which the academic year ends).
+        """
+        return f"HD{year}", f"SFA{str(year - 1)[-2:]}{str(year)[-2:]}"
 
-    def _data_loader(self):
+    def _csv_path(self, folder):
         """
-        Loads and merges Directory Information and Student Financial Aid and Net Price data by year, returning a panel data.
+        Returns the path of the raw CSV file inside a raw data folder.
         """
-        # Step 1: Construct folder names based on year range
-        folders = []
-        for year in range(self.start + 1, self.end + 2):  # shift by +1 to align with folder names
-            folders.append(f"HD{year}")
-            folders.append(f"SFA{str(year - 1)[-2:]}{str(year)[-2:]}")
+        return os.path.join("Raw Data", folder, folder.lower() + ".csv")
 
+    @traced('read_folder', attrs=lambda self, folder: {'folder': folder})
+    def _read_folder(self, folder):
+        """
+        Parses one raw CSV file, keeping only the variables used in the panel.
+        A cached copy is used when the file has not changed since it was last parsed.
 
-        data_dict = {}
-        for folder in folders:
-            csv_filename = folder.lower() + ".csv"
-            csv_path = os.path.join("Raw Data", folder, csv_filename)
+        folder: raw data folder name, e.g. 'HD2016' or 'SFA1516'
+        """
+        csv_path = self._csv_path(folder)
+        try:
+            # Only the variables kept in the panel are parsed, with dtypes compiled from the variable dictionaries
+            columns = HD_COLUMNS if folder.startswith("HD") else SFA_COLUMNS
+            dtypes = self.schema._dtypes(columns)
+            if self.use_cache:
+                df = self.cache._load(csv_path, columns, dtypes)
+                if df is not None:
+                    return df
+            df = self.schema._read_csv(csv_path, columns)
+            if self.use_cache:
+                self.cache._store(csv_path, columns, dtypes, df)
+            return df
+        except Exception as e:
+            raise RuntimeError(f"Failed to load {csv_path}: {e}")
+
+    def _key_join(self, hd_ids, sfa_ids):
+        """
+        Inner-joins two UNITID arrays. UNITIDs are compact integers, so the SFA keys are usually indexed by a direct-address
+        table (position of each key, offset by the smallest key) and every HD key is looked up in O(1); duplicated SFA keys or
+        keys spread over a wide range fall back to sorting the SFA keys once and matching the HD keys with searchsorted.
+        Returns the HD and SFA row positions of the matched pairs in HD order (the order of pd.merge(how='inner') for unique keys;
+        duplicated keys give every pair, in SFA order within an HD row), and counts of duplicated and unmatched keys on each side.
+
+        hd_ids: UNITID array of the HD file
+        sfa_ids: UNITID array of the SFA file
+        """
+        if not len(hd_ids) or not len(sfa_ids):
+            empty = np.empty(0, dtype=np.int64)
+            report = {'hd_duplicates': len(hd_ids) - len(np.unique(hd_ids)), 'sfa_duplicates': len(sfa_ids) - len(np.unique(sfa_ids)),
+                      'hd_unmatched': len(hd_ids), 'sfa_unmatched': len(sfa_ids)}
+            return empty, empty, report
+
+        # Step 1: Key counts over the common key range, which give the duplicates and unmatched keys of both files
+        lo = min(hd_ids.min(), sfa_ids.min())
+        span = int(max(hd_ids.max(), sfa_ids.max())) - int(lo) + 1
+        if span <= 8 * (len(hd_ids) + len(sfa_ids)) + 2**20:
+            hd_keys, sfa_keys = hd_ids.astype(np.int64) - lo, sfa_ids.astype(np.int64) - lo
+            hd_counts = np.bincount(hd_keys, minlength=span)
+            sfa_counts = np.bincount(sfa_keys, minlength=span)
+            report = {
+                'hd_duplicates': len(hd_ids) - int(np.count_nonzero(hd_counts)),
+                'sfa_duplicates': len(sfa_ids) - int(np.count_nonzero(sfa_counts)),
+                'hd_unmatched': int(np.count_nonzero(sfa_counts[hd_keys] == 0)),
+                'sfa_unmatched': int(np.count_nonzero(hd_counts[sfa_keys] == 0))
+            }
+            # Step 2: With unique SFA keys, a direct-address table maps each HD key to its SFA row
+            if report['sfa_duplicates'] == 0:
+                table = np.full(span, -1, dtype=np.int64)
+                table[sfa_keys] = np.arange(len(sfa_ids))
+                match = table[hd_keys]
+                hd_rows = np.flatnonzero(match >= 0)
+                return hd_rows, match[hd_rows], report
+        else:
+            hd_sorted = np.sort(hd_ids)
+            found = np.searchsorted(hd_sorted, sfa_ids).clip(max=len(hd_sorted) - 1)
+            report = {'hd_duplicates': int(np.count_nonzero(hd_sorted[1:] == hd_sorted[:-1])),
+                      'sfa_duplicates': len(sfa_ids) - len(np.unique(sfa_ids)),
+                      'sfa_unmatched': int(np.count_nonzero(hd_sorted[found] != sfa_ids))}
+
+        # Step 3: Otherwise, find the range of SFA rows of each HD key in the sorted SFA keys
+        sfa_order = np.argsort(sfa_ids, kind='stable')
+        sfa_sorted = sfa_ids[sfa_order]
+        first = np.searchsorted(sfa_sorted, hd_ids, side='left')
+        counts = np.searchsorted(sfa_sorted, hd_ids, side='right') - first
+        report['hd_unmatched'] = int(np.count_nonzero(counts == 0))
+
+        # Step 4: One output pair per matched (HD row, SFA row); a pair's SFA row is first plus its position within the HD row's run
+        hd_rows = np.repeat(np.arange(len(hd_ids)), counts)
+        run_start = np.cumsum(counts) - counts
+        sfa_rows = sfa_order[np.repeat(first - run_start, counts) + np.arange(len(hd_rows))]
+        return hd_rows, sfa_rows, report
+
+    @traced('load_year', attrs=lambda self, year: {'year': year - 1})
+    def _load_year(self, year):
+        """
+        Loads the HD and SFA files of one folder year and matches their UNITIDs.
+        Returns the year's part of the panel (academic year, HD frame, SFA frame, matched HD rows, matched SFA rows),
+        the (file key, shape) pairs of the files read and the join report, so the caller can report them in order.
+        Failures are raised as RuntimeError with the message to report, which also works from a worker process.
 
+        year: folder year (academic year start + 1)
+        """
+        hd_folder, sfa_folder = self._year_folders(year)
+        hd_key, sfa_key = hd_folder.lower(), sfa_folder.lower()
+        hd_raw = self._read_folder(hd_folder)
+        sfa_raw = self._read_folder(sfa_folder)
+
+        try:
+            hd_df = hd_raw[HD_COLUMNS]
+            sfa_df = sfa_raw[SFA_COLUMNS]
+        except KeyError as e:
+            raise RuntimeError(f"Error: Required variable missing in {hd_key} or {sfa_key} — {e}")
+
+        with self.tracer._span('join', rows_in=len(hd_df) + len(sfa_df), year=year - 1) as record:
+            hd_rows, sfa_rows, report = self._key_join(hd_df['UNITID'].to_numpy(), sfa_df['UNITID'].to_numpy())
+            record['rows_out'] = len(hd_rows)
+            record.update(report)
+        part = (year - 1, hd_df, sfa_df, hd_rows, sfa_rows)
+        return part, [(hd_key, hd_raw.shape), (sfa_key, sfa_raw.shape)], report
+
+    def _load_years(self, years):
+        """
+        Checks that the raw files of the given folder years exist, then loads and matches each year pair,
+        serially or in a process pool. Returns the parts of the panel in year order (see _load_year), to be assembled by _join_panel.
 
-            if not os.path.exists(csv_path):
-                print(f"Error: {csv_path} not found!")
-                sys.exit(1)
+        years: list of folder years (academic year start + 1)
+        """
+        # Step 1: Construct folder names and check that every file exists
+        for year in years:
+            for folder in self._year_folders(year):
+                csv_path = self._csv_path(folder)
+                if not os.path.exists(csv_path):
+                    print(f"Error: {csv_path} not found!")
+                    sys.exit(1)
+
+        # Step 2: Load and match each year pair, serially or in a process pool
+        try:
+            if self.n_jobs > 1 and len(years) > 1:
+                with ProcessPoolExecutor(max_workers=min(self.n_jobs, len(years))) as pool:
+                    results = []
+                    for result, spans in pool.map(_load_year_traced, [self] * len(years), years):
+                        self.tracer._attach(spans)
+                        results.append(result)
+            else:
+                results = [self._load_year(year) for year in years]
+        except RuntimeError as e:
+            print(e)
+            sys.exit(1)
+
+        parts = []
+        for part, shapes, report in results:
+            for key, shape in shapes:
+                print(f"{key} loaded with shape {shape}")
+            (hd_key, _), (sfa_key, _) = shapes
+            print(f"{hd_key} x {sfa_key} joined: {len(part[3])} rows; {report['hd_unmatched']} HD without SFA, "
+                  f"{report['sfa_unmatched']} SFA without HD, {report['hd_duplicates']} + {report['sfa_duplicates']} duplicate UNITIDs")
+            parts.append(part)
+        return parts
+
+    def _gather_column(self, columns, rows, bounds, binary=False):
+        """
+        Writes the matched rows of one raw column of every year into a single preallocated panel column.
+        Categories are unified across years; nullable integer columns keep their values and missing mask.
 
-            try:
-                df = pd.read_csv(csv_path, encoding='latin1')
-                data_dict[folder.lower()] = df
-                print(f"{folder.lower()} loaded with shape {df.shape}")
-            except Exception as e:
-                print(f"Failed to load {csv_path}: {e}")
-                sys.exit(1)
+        columns: the column of each year (Series)
+        rows: the matched row positions of each year
+        bounds: start of each year in the panel, and the panel length last
+        binary: whether to recode the column to 0/1 (missing codes count as 0), as _format_panel does
+        """
+        n = bounds[-1]
+        dtype = columns[0].dtype
+        if binary:
+            out = np.empty(n, dtype='int64')
+            for col, idx, lo, hi in zip(columns, rows, bounds[:-1], bounds[1:]):
+                out[lo:hi] = col.eq(1).to_numpy(dtype=bool, na_value=False)[idx]
+            return out
+        if any(col.dtype != dtype for col in columns):
+            # Years parsed with different dtypes fall back to pandas' concatenation rules
+            return pd.concat([col.iloc[idx] for col, idx in zip(columns, rows)], ignore_index=True).array
+        if isinstance(dtype, pd.CategoricalDtype):
+            categories = columns[0].cat.categories
+            for col in columns[1:]:
+                categories = categories.union(col.cat.categories)
+            codes = np.empty(n, dtype='int32')
+            for col, idx, lo, hi in zip(columns, rows, bounds[:-1], bounds[1:]):
+                recode = np.append(categories.get_indexer(col.cat.categories), -1)
+                codes[lo:hi] = recode[col.cat.codes.to_numpy()[idx]]
+            return pd.Categorical.from_codes(codes, dtype=pd.CategoricalDtype(categories, ordered=dtype.ordered))
+        if isinstance(dtype, pd.api.extensions.ExtensionDtype) and hasattr(dtype, 'numpy_dtype'):
+            values = np.empty(n, dtype=dtype.numpy_dtype)
+            mask = np.empty(n, dtype=bool)
+            for col, idx, lo, hi in zip(columns, rows, bounds[:-1], bounds[1:]):
+                values[lo:hi] = col.to_numpy(dtype=dtype.numpy_dtype, na_value=0)[idx]
+                mask[lo:hi] = col.isna().to_numpy()[idx]
+            return type(columns[0].array)(values, mask)
+        if isinstance(dtype, np.dtype):
+            out = np.empty(n, dtype=dtype)
+            for col, idx, lo, hi in zip(columns, rows, bounds[:-1], bounds[1:]):
+                out[lo:hi] = col.to_numpy()[idx]
+            return out
+        return pd.concat([col.iloc[idx] for col, idx in zip(columns, rows)], ignore_index=True).array
+
+    @traced('join_panel', rows_in=lambda self, parts: sum(len(part[3]) for part in parts))
+    def _join_panel(self, parts):
+        """
+        Assembles the formatted panel from the matched rows of each year in one pass: every column is written straight
+        into a preallocated array for the whole panel, without per-year merged frames, copies or concatenation.
+        The result is the same as renaming and formatting (_format_panel) the concatenated pd.merge of each year.
 
-        # Step 2: Assemble yearly panel data
-        panel_dfs = []
+        parts: parts of the panel in year order, as returned by _load_years
+        """
+        bounds = np.concatenate([[0], np.cumsum([len(part[3]) for part in parts])]).astype(np.int64)
+        panel = {}
+        for source, position, cols in [(1, 3, HD_COLUMNS), (2, 4, SFA_COLUMNS[1:])]:
+            for col in cols:
+                name = RENAME_COLUMNS[col]
+                panel[name] = self._gather_column([part[source][col] for part in parts], [part[position] for part in parts],
+                                                  bounds, binary=name in BINARY_COLUMNS)
+        panel['year'] = np.repeat(np.array([part[0] for part in parts], dtype='int64'), np.diff(bounds))
+        # The columns are already the panel's own arrays, so the frame takes them without copying
+        return pd.DataFrame(panel, copy=False)
+
+    def _format_panel(self, panel_data):
+        """
+        Renames the raw variables and recodes the binary columns to 0/1.
 
-        for year in range(self.start + 1, self.end + 2):
-            hd_key = f'hd{year}'
-            sfa_key = f'sfa{str(year - 1)[-2:]}{str(year)[-2:]}'
-            new_year = year - 1
+        panel_data: merged HD/SFA data of one or more years
+        """
+        # Step 1: Rename columns
+        panel_data = panel_data.rename(columns=RENAME_COLUMNS)
 
-            if hd_key not in data_dict or sfa_key not in data_dict:
-                print(f"Error: Missing data for {hd_key} or {sfa_key}")
-                sys.exit(1)
+        # Step 2: Clean binary columns to be 0/1 (missing codes count as 0)
+        for col in BINARY_COLUMNS:
+            panel_data[col] = np.where(panel_data[col].eq(1).to_numpy(dtype=bool, na_value=False), 1, 0)
 
-            try:
-                hd_df = data_dict[hd_key][['UNITID', 'STABBR', 'HLOFFER', 'UGOFFER', 'CONTROL']].copy()
-                sfa_df = data_dict[sfa_key][['UNITID', 'SCUGFFN', 'FGRNT_T']].copy()
-            except KeyError as e:
-                print(f"Error: Required variable missing in {hd_key} or {sfa_key} — {e}")
-                sys.exit(1)
+        return panel_data
 
-            merged = pd.merge(hd_df, sfa_df, on='UNITID', how='inner')
-            merged['year'] = new_year
-            panel_dfs.append(merged)
+    @traced('data_loader')
+    def _data_loader(self):
+        """
+        Loads and joins Directory Information and Student Financial Aid and Net Price data by year, returning a panel data.
+        With n_jobs > 1 each (HD, SFA) year pair is loaded and matched in its own worker process; the result is identical to the serial path.
+        """
+        # Step 1: Load each year pair and match its UNITIDs (shift by +1 to align with folder names)
+        parts = self._load_years(list(range(self.start + 1, self.end + 2)))
 
-        # Step 3: Concatenate all years
-        panel_data = pd.concat(panel_dfs, ignore_index=True)
+        # Step 2: Write the matched rows of all years into the renamed and formatted panel columns
+        return self._join_panel(parts)
 
-        # Step 4: Rename columns
-        panel_data = panel_data.rename(columns={
-            'UNITID': 'ID_IPEDS',
-            'STABBR': 'stabbr',
-            'HLOFFER': 'highest_degree',
-            'UGOFFER': 'degree_bach',
-            'CONTROL': 'public',
-            'SCUGFFN': 'enroll_ftug',
-            'FGRNT_T': 'grant_federal'
-        })
+    def _exclude_list(self):
+        """
+        Returns excluding_states as a list of state abbreviations.
+        """
+        if isinstance(self.excluding_states, str):
+            return [self.excluding_states]
+        elif isinstance(self.excluding_states, list):
+            return self.excluding_states
+        else:
+            raise ValueError("excluding_states must be a string or a list of strings.")
 
-        # Step 5: Clean binary columns to be 0/1
-        panel_data["degree_bach"] = panel_data["degree_bach"].apply(lambda x: 1 if x == 1 else 0)
-        panel_data["public"] = panel_data["public"].apply(lambda x: 1 if x == 1 else 0)
+    def _row_mask(self, panel_data):
+        """
+        Returns a boolean array marking the rows that pass the row-level cleaning criteria, which do not depend on other years:
+        - Remove non-undergraduate institutions if undergraduate_institutions is True.
+        - Remove specified states if excluding_states is not empty.
+        - Drop rows with missing values if balanced_panel is True.
 
+        panel_data: raw panel data of one or more years
+        """
+        # Step 1: Filter undergraduate institutions
+        keep = np.ones(len(panel_data), dtype=bool)
+        if self.undergraduate_institutions:
+            with self.tracer._span('filter_undergraduate', rows_in=keep) as record:
+                keep &= panel_data['degree_bach'].eq(1).to_numpy(dtype=bool, na_value=False)
+                record['rows_out'] = keep
 
-        return panel_data
+        # Step 2: Exclude specified states
+        exclude_list = self._exclude_list()
+        with self.tracer._span('filter_states', rows_in=keep) as record:
+            keep &= ~panel_data['stabbr'].isin(exclude_list).to_numpy(dtype=bool)
+            record['rows_out'] = keep
+
+        # Step 3: Rows with missing values cannot count towards a balanced panel
+        if self.balanced_panel:
+            with self.tracer._span('filter_missing', rows_in=keep) as record:
+                keep &= panel_data.notna().all(axis=1).to_numpy(dtype=bool)
+                record['rows_out'] = keep
+
+        return keep
 
+    def _filter_rows(self, panel_data):
+        """
+        Applies the row-level cleaning criteria (see _row_mask) with a single selection.
+
+        panel_data: raw panel data of one or more years
+        """
+        panel_data_clean = panel_data[self._row_mask(panel_data)]
+        if self.balanced_panel and panel_data_clean['year'].dtype.kind != 'i':
+            panel_data_clean = panel_data_clean.astype({'year': int})
+        return panel_data_clean
+
+    def _complete_rows(self, ids, years):
+        """
+        Returns a boolean array marking the rows of institutions observed in every year from start to end and in no other year.
+        Distinct years are counted with one presence matrix (institution x year) instead of per-institution Python sets.
+
+        ids: array of institution identifiers
+        years: array of years, aligned with ids
+        """
+        n_years = self.end - self.start + 1
+        codes, uniques = pd.factorize(ids)
+        offset = np.asarray(years, dtype=np.int64) - self.start
+        in_range = (offset >= 0) & (offset < n_years)
+
+        seen = np.zeros((len(uniques), n_years), dtype=bool)
+        seen[codes[in_range], offset[in_range]] = True
+        outside = np.bincount(codes[~in_range], minlength=len(uniques)) > 0
+
+        complete = seen.all(axis=1) & ~outside
+        return complete[codes]
+
+    @traced('data_cleaner', rows_in=lambda self, panel_data: panel_data)
     def _data_cleaner(self, panel_data):
         """
         Cleans the loaded panel data based on user-specified criteria:
         - Remove non-undergraduate institutions if undergraduate_institutions is True.
         - Remove specified states if excluding_states is not empty.
         - Keep only balanced panel data if balanced_panel is True.
+        All criteria are combined into one boolean mask, so the data is copied only once.
 
         panel_data: raw panel data
         """
-        panel_data_clean = panel_data.copy()
+        # Step 1: Mark rows passing the row-level filters
+        keep = self._row_mask(panel_data)
 
-        # Step 1: Filter undergraduate institutions
-        if self.undergraduate_institutions:
-            panel_data_clean = panel_data_clean[panel_data_clean['degree_bach'] == 1].copy()
+        # Step 2: Keep only balanced panel institutions
+        if self.balanced_panel:
+            with self.tracer._span('filter_balanced', rows_in=keep) as record:
+                ids = panel_data['ID_IPEDS'].to_numpy()[keep]
+                years = panel_data['year'].to_numpy()[keep]
+                keep[keep] = self._complete_rows(ids, years)
+                record['rows_out'] = keep
 
-        # Step 2: Exclude specified states
-        if isinstance(self.excluding_states, str):
-            exclude_list = [self.excluding_states]
-        elif isinstance(self.excluding_states, list):
-            exclude_list = self.excluding_states
-        else:
-            raise ValueError("excluding_states must be a string or a list of strings.")
+        # Step 3: Select the remaining rows once
+        panel_data_clean = panel_data[keep]
+        if self.balanced_panel and panel_data_clean['year'].dtype.kind != 'i':
+            panel_data_clean = panel_data_clean.astype({'year': int})
 
-        panel_data_clean = panel_data_clean[~panel_data_clean['stabbr'].isin(exclude_list)].copy()
+        return panel_data_clean
 
-        # Step 3: Keep only balanced panel institutions
-        if self.balanced_panel:
-            panel_data_clean = panel_data_clean.dropna().copy()
-            panel_data_clean['year'] = panel_data_clean['year'].astype(int)
-            expected_years = set(range(self.start, self.end + 1))
 
-            id_years = panel_data_clean.groupby('ID_IPEDS')['year'].apply(set)
-            complete_ids = id_years[id_years.apply(lambda x: x == expected_years)].index
-            panel_data_clean = panel_data_clean[panel_data_clean['ID_IPEDS'].isin(complete_ids)].copy()
+    def _sfa_index(self, year):
+        """
+        Reads the projected SFA file of one folder year in chunks and returns it indexed by UNITID for joining HD chunks.
 
-        return panel_data_clean
+        year: folder year (academic year start + 1)
+        """
+        _, sfa_folder = self._year_folders(year)
+        sfa_chunks = []
+        for chunk in self.schema._iter_csv(self._csv_path(sfa_folder), SFA_COLUMNS, self.chunksize):
+            sfa_chunks.append(chunk[SFA_COLUMNS])
+        return pd.concat(sfa_chunks, ignore_index=True).set_index('UNITID')
 
+    def _stream_year(self, year):
+        """
+        Yields the formatted rows of one folder year chunk by chunk, with the row-level filters pushed down into ingestion:
+        the state and bachelor's-degree predicates are applied to each HD chunk before it is joined with the indexed SFA table.
 
-    def _data_exporter(self, panel_data_clean):
+        year: folder year (academic year start + 1)
+        """
+        hd_folder, sfa_folder = self._year_folders(year)
+        hd_key, sfa_key = hd_folder.lower(), sfa_folder.lower()
+        exclude_list = self._exclude_list()
+        try:
+            sfa = self._sfa_index(year)
+            for hd_chunk in self.schema._iter_csv(self._csv_path(hd_folder), HD_COLUMNS, self.chunksize):
+                hd_chunk = hd_chunk[HD_COLUMNS]
+
+                # Step 1: Apply the state and degree predicates on the raw HD columns
+                keep = ~hd_chunk['STABBR'].isin(exclude_list).to_numpy(dtype=bool)
+                if self.undergraduate_institutions:
+                    keep &= hd_chunk['UGOFFER'].eq(1).to_numpy(dtype=bool, na_value=False)
+
+                # Step 2: Join the surviving rows with the SFA table and format them like _data_loader
+                merged = hd_chunk[keep].join(sfa, on='UNITID', how='inner')
+                merged['year'] = year - 1
+                chunk = self._format_panel(merged)
+                if self.balanced_panel:
+                    chunk = chunk[chunk.notna().all(axis=1).to_numpy(dtype=bool)]
+                yield chunk
+        except KeyError as e:
+            print(f"Error: Required variable missing in {hd_key} or {sfa_key} — {e}")
+            sys.exit(1)
+
+    def _data_streamer(self):
+        """
+        Yields the cleaned panel chunk by chunk, so that peak memory is bounded by chunksize rather than by the raw data.
+        The rows, their order and the cleaning criteria are the same as _data_cleaner(_data_loader()).
+        With balanced_panel, a first pass keeps only the IDs observed in each year, and a second pass emits the complete institutions.
+        """
+        # Step 1: Check that every file exists
+        years = list(range(self.start + 1, self.end + 2))  # shift by +1 to align with folder names
+        for year in years:
+            for folder in self._year_folders(year):
+                csv_path = self._csv_path(folder)
+                if not os.path.exists(csv_path):
+                    print(f"Error: {csv_path} not found!")
+                    sys.exit(1)
+
+        # Step 2: Find institutions observed in every year, intersecting the per-year ID sets as they stream by
+        complete_ids = None
+        if self.balanced_panel:
+            for year in years:
+                year_ids = [np.unique(chunk['ID_IPEDS'].to_numpy()) for chunk in self._stream_year(year)]
+                year_ids = np.unique(np.concatenate(year_ids)) if year_ids else np.empty(0, dtype=np.int64)
+                complete_ids = year_ids if complete_ids is None else np.intersect1d(complete_ids, year_ids, assume_unique=True)
+
+        # Step 3: Emit the cleaned rows
+        for year in years:
+            for chunk in self._stream_year(year):
+                if complete_ids is not None:
+                    chunk = chunk[chunk['ID_IPEDS'].isin(complete_ids).to_numpy(dtype=bool)]
+                if len(chunk):
+                    yield chunk
+
+    def _stream_exporter(self):
+        """
+        Streams the cleaned panel straight into 'clean_data.csv' in the same directory, one chunk at a time,
+        without holding the full panel in memory.
+        """
+        current_dir = os.path.dirname(os.path.abspath(__file__))
+        output_path = os.path.join(current_dir, 'clean_data.csv')
+
+        n_rows = 0
+        with open(output_path, 'w', encoding='latin1', newline='') as f:
+            for chunk in self._data_streamer():
+                chunk.to_csv(f, index=False, header=(n_rows == 0))
+                n_rows += len(chunk)
+
+        print(f"Cleaned data ({n_rows} rows) streamed to {output_path}")
+
+    @traced('data_exporter', rows_in=lambda self, panel_data_clean, *args, **kwargs: panel_data_clean)
+    def _data_exporter(self, panel_data_clean, binary=False, output_dir=None):
         """
         Exports the cleaned panel data to a CSV file named 'clean_data.csv' in the same directory
         
         panel_data_clean: clean panel data
+        binary: whether to also write the compact binary copy 'clean_data/' (see PanelFile), which later stages can memory-map
+        output_dir: directory to export to instead of the directory of this file
         """
-        current_dir = os.path.dirname(os.path.abspath(__file__))
+        current_dir = output_dir or os.path.dirname(os.path.abspath(__file__))
         output_path = os.path.join(current_dir, 'clean_data.csv')
 
         panel_data_clean.to_csv(output_path, index=False, encoding='latin1')
 
         print(f"Cleaned data exported to {output_path}")
 
-
-
+        if binary:
+            binary_path = os.path.join(current_dir, 'clean_data')
+            PanelFile(binary_path)._write(panel_data_clean)
+            print(f"Cleaned data exported to {binary_path}")
@@ -0,0 +1,138 @@
+import os
+import glob
+import json
+import pandas as pd
+
+class DataSchema():
+    # Compiled column -> dtype maps shared by every instance in the process, keyed by dictionary signature
+    _compiled = {}
+
+    def __init__(self, dictionary_dir=os.path.join("Raw Data", "Dictionary"), cache_dir="Cache", key_column="UNITID"):
+        """
+        dictionary_dir: folder holding the IPEDS variable dictionaries (one subfolder per file, each with an .xlsx)
+        cache_dir: folder where the compiled column-to-dtype map is persisted between runs
+        key_column: institution identifier, always parsed as int32
+        """
+        self.dictionary_dir = dictionary_dir
+        self.cache_dir = cache_dir
+        self.key_column = key_column
+
+    def _dictionary_files(self):
+        """
+        Lists the dictionary workbooks found under dictionary_dir.
+        """
+        return sorted(glob.glob(os.path.join(self.dictionary_dir, "*", "*.xlsx")))
+
+    def _signature(self, files):
+        """
+        Identifies the current set of dictionaries by path, size and modification time.
+        """
+        return [[path, os.path.getsize(path), os.path.getmtime(path)] for path in files]
+
+    def _column_dtype(self, data_type, fmt, width):
+        """
+        Translates one dictionary entry (DataType, format, Fieldwidth) into a compact pandas dtype.
+        """
+        if data_type == 'A':
+            return 'category' if fmt == 'Disc' else 'object'
+        if fmt == 'Disc':
+            # Coded values such as CONTROL or HLOFFER; nullable so that blanks do not break parsing
+            if width <= 2:
+                return 'Int8'
+            if width <= 4:
+                return 'Int16'
+            return 'Int32'
+        # Continuous values: counts fit in int32, wide fields (dollar amounts, coordinates) stay float
+        return 'Int32' if width <= 9 else 'float64'
+
+    def _compile(self):
+        """
+        Reads the 'varlist' sheet of every dictionary once and compiles a column-to-dtype map.
+        The map is cached in memory and on disk, and rebuilt only when a dictionary file changes.
+        """
+        files = self._dictionary_files()
+        signature = self._signature(files)
+        cache_key = json.dumps(signature)
+        if cache_key in DataSchema._compiled:
+            return DataSchema._compiled[cache_key]
+
+        # Step 1: Try the on-disk cache
+        cache_path = os.path.join(self.cache_dir, "schema.json")
+        if os.path.exists(cache_path):
+            try:
+                with open(cache_path, encoding='utf-8') as f:
+                    cached = json.load(f)
+                if cached.get('signature') == signature:
+                    DataSchema._compiled[cache_key] = cached['dtypes']
+                    return cached['dtypes']
+            except (OSError, ValueError):
+                pass
+
+        # Step 2: Compile from the dictionaries
+        dtypes = {}
+        for path in files:
+            varlist = pd.read_excel(path, sheet_name='varlist')
+            for _, row in varlist.iterrows():
+                dtypes[row['varname']] = self._column_dtype(row['DataType'], row['format'], int(row['Fieldwidth']))
+        dtypes[self.key_column] = 'int32'
+
+        # Step 3: Persist for later runs
+        try:
+            os.makedirs(self.cache_dir, exist_ok=True)
+            with open(cache_path, 'w', encoding='utf-8') as f:
+                json.dump({'signature': signature, 'dtypes': dtypes}, f)
+        except OSError as e:
+            print(f"Warning: could not write schema cache {cache_path}: {e}")
+
+        DataSchema._compiled[cache_key] = dtypes
+        return dtypes
+
+    def _dtypes(self, columns):
+        """
+        Returns the dtype map restricted to the given columns; columns missing from the dictionaries are inferred by pandas.
+
+        columns: list of raw variable names to load
+        """
+        dtypes = self._compile()
+        return {col: dtypes[col] for col in columns if col in dtypes}
+
+    def _read_csv(self, csv_path, columns):
+        """
+        Loads only the requested columns of a raw IPEDS file with compact dtypes.
+        Falls back to pandas type inference if a file does not match the dictionary (e.g. decimals in an integer field).
+
+        csv_path: path to the raw CSV file
+        columns: list of raw variable names to load
+        """
+        # A callable keeps absent columns from raising here, so the caller still reports them as missing variables
+        usecols = lambda name: name in columns
+        try:
+            return pd.read_csv(csv_path, encoding='latin1', usecols=usecols, dtype=self._dtypes(columns))
+        except (ValueError, TypeError):
+            return pd.read_csv(csv_path, encoding='latin1', usecols=usecols)
+
+    def _iter_csv(self, csv_path, columns, chunksize):
+        """
+        Yields the requested columns of a raw IPEDS file in chunks of chunksize rows with compact dtypes.
+        If a chunk does not match the dictionary, the remaining rows are re-read with pandas type inference.
+
+        csv_path: path to the raw CSV file
+        columns: list of raw variable names to load
+        chunksize: number of rows per chunk
+        """
+        usecols = lambda name: name in columns
+        rows_done = 0
+        try:
+            with pd.read_csv(csv_path, encoding='latin1', usecols=usecols, dtype=self._dtypes(columns),
+                             chunksize=chunksize) as reader:
+                for chunk in reader:
+                    yield chunk
+                    rows_done += len(chunk)
+            return
+        except (ValueError, TypeError):
+            pass
+        # Skip the data rows already yielded, keeping the header line
+        with pd.read_csv(csv_path, encoding='latin1', usecols=usecols, chunksize=chunksize,
+                         skiprows=range(1, rows_done + 1)) as reader:
+            for chunk in reader:
+                yield chunk
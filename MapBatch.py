@@ -0,0 +1,276 @@
+import os
+import zlib
+import struct
+import numpy as np
+import matplotlib.pyplot as plt
+from matplotlib.gridspec import GridSpec
+from matplotlib.path import Path
+from matplotlib.patches import PathPatch
+from matplotlib.collections import PatchCollection
+from mpl_toolkits.axes_grid1 import make_axes_locatable
+from concurrent.futures import ProcessPoolExecutor
+from MapMaker import MapMaker, SHAPEFILE_PATH, LABEL_OFFSETS, FILE_FORMATS
+from Tracer import Tracer, traced
+
+# Each worker process pays for its start, the base layer load and its own template (patches, labels, crop), together
+# a few maps' worth of rendering; jobs are only spread across workers that each get at least this many
+MIN_JOBS_PER_WORKER = 8
+
+def _render_chunk(batch):
+    """
+    Renders one MapBatch in a worker process with the non-interactive Agg backend.
+    Returns the saved paths and the spans the worker recorded.
+    """
+    plt.switch_backend('Agg')
+    return batch._render(), batch.tracer._detach()
+
+class MapBatch():
+    def __init__(self, jobs, n_jobs=1, shapefile_path=SHAPEFILE_PATH, cache_dir=os.path.join("Cache", "map"),
+                 tolerance=None, file_format='png', tracer=None, output_dir=None):
+        """
+        jobs: list of (data, col, export_name) tuples, each describing one map as in MapMaker
+        n_jobs: number of worker processes the jobs are spread across (1 renders them in this process)
+        shapefile_path: path to the U.S. state shapefile
+        cache_dir: folder where the processed base layer is persisted between runs
+        tolerance: level of detail, as a simplification tolerance in degrees (None keeps the full resolution), see MapMaker
+        file_format: 'png' (300 dpi raster), or 'svg' / 'pdf' for compact vector output
+        tracer: Tracer recording the time and memory of the template and of each map (None for no tracing)
+        output_dir: folder the images are saved to (None for the Figure folder of the working directory)
+        """
+        if file_format not in FILE_FORMATS:
+            raise ValueError(f"file_format must be one of {FILE_FORMATS}.")
+        self.jobs = list(jobs)
+        self.n_jobs = n_jobs
+        self.shapefile_path = shapefile_path
+        self.cache_dir = cache_dir
+        self.tolerance = tolerance
+        self.file_format = file_format
+        self.tracer = tracer or Tracer()
+        self.output_dir = output_dir
+
+    def _geometry_path(self, geom):
+        """
+        Converts a (multi)polygon into one compound matplotlib path, so that each state is a single patch.
+        """
+        polygons = geom.geoms if geom.geom_type == 'MultiPolygon' else [geom]
+        rings = []
+        for polygon in polygons:
+            for ring in [polygon.exterior, *polygon.interiors]:
+                rings.append(Path(np.asarray(ring.coords)[:, :2], closed=True))
+        return Path.make_compound_path(*rings)
+
+    def _set_aspect(self, ax, states):
+        """
+        Applies the aspect ratio geopandas uses for geographic coordinates, based on the middle latitude of the states.
+        """
+        bounds = states.total_bounds
+        y_coord = np.mean([bounds[1], bounds[3]])
+        ax.set_aspect(1 / np.cos(y_coord * np.pi / 180))
+
+    def _crop(self, fig):
+        """
+        Crops the figure to its tight bounding box at 300 dpi, as bbox_inches='tight' does when saving, by fixing each axes
+        at its drawn position (after the aspect ratio and the colorbar locator are applied), moving it into the crop
+        and resizing the figure. The crop is measured once, so each job is then saved with a single draw.
+        """
+        fig.set_dpi(300)
+        fig.canvas.draw()
+        bbox = fig.get_tightbbox(fig.canvas.get_renderer()).padded(plt.rcParams['savefig.pad_inches'])
+        width, height = fig.get_size_inches()
+        for ax in fig.axes:
+            x0, y0, w, h = ax.get_position().bounds
+            ax.set_axes_locator(None)
+            ax.set_position([(x0 * width - bbox.x0) / bbox.width, (y0 * height - bbox.y0) / bbox.height,
+                             w * width / bbox.width, h * height / bbox.height])
+        fig.set_size_inches(bbox.width, bbox.height)
+
+    def _write_png(self, fig_path, rows):
+        """
+        Writes an RGBA image as a PNG file with unfiltered rows, tagged with its 300 dpi resolution.
+        The maps are mostly flat colors, which deflate compresses well without row filters: skipping the filter search
+        of the default encoder (and compressing at level 4) writes smaller files than savefig in about a third of the time.
+
+        fig_path: path of the PNG file
+        rows: uint8 array of shape (height, 1 + 4 * width), each row a zero filter byte followed by its RGBA values
+        """
+        def chunk(tag, data):
+            return struct.pack('>I', len(data)) + tag + data + struct.pack('>I', zlib.crc32(tag + data))
+        height, width = rows.shape[0], (rows.shape[1] - 1) // 4
+        pixels_per_meter = round(300 / 0.0254)
+        with open(fig_path, 'wb') as f:
+            f.write(b'\x89PNG\r\n\x1a\n')
+            f.write(chunk(b'IHDR', struct.pack('>IIBBBBB', width, height, 8, 6, 0, 0, 0)))
+            f.write(chunk(b'pHYs', struct.pack('>IIB', pixels_per_meter, pixels_per_meter, 1)))
+            f.write(chunk(b'IDAT', zlib.compress(rows, 4)))
+            f.write(chunk(b'IEND', b''))
+
+    @traced('map_template')
+    def _template(self):
+        """
+        Builds the figure once: Hawaii inset and main axes with one patch per state, state labels, title and colorbar,
+        cropped as bbox_inches='tight' would crop it (with the longest title of the jobs).
+        Returns the artists that _draw updates for each job.
+        """
+        # Step 1: Load the cached base layer and lay out the figure as MapMaker does
+        base = MapMaker(None, None, None, self.shapefile_path, self.cache_dir, tracer=self.tracer)._base_layer(self.tolerance)
+        norm = plt.Normalize(vmin=0, vmax=1)
+        cmap = plt.get_cmap('RdYlBu_r')
+        fig = plt.figure(figsize=(24, 6))
+        gs = GridSpec(1, 2, width_ratios=[1, 50], wspace=-0.8)
+        ax_hi = fig.add_subplot(gs[0, 0])
+        ax_main = fig.add_subplot(gs[0, 1])
+
+        # Step 2: Add one patch collection per axes; Alaska is drawn last on the main axes, as in MapMaker
+        collections = []
+        for ax, panels in [(ax_hi, ['hawaii']), (ax_main, ['mainland', 'alaska'])]:
+            states = base[base['panel'].isin(panels)]
+            patches = [PathPatch(self._geometry_path(geom)) for geom in states['geometry']]
+            collection = PatchCollection(patches, cmap=cmap, norm=norm, linewidth=0.8, edgecolor='0.8')
+            ax.add_collection(collection)
+            ax.autoscale_view()
+            self._set_aspect(ax, base[base['panel'] == panels[-1]])
+            ax.axis('off')
+            collections.append((collection, states['STUSPS'].to_numpy()))
+
+        # Step 3: Add state abbreviations
+        labels = {}
+        for abbr, panel, x, y in zip(base['STUSPS'], base['panel'], base['label_x'], base['label_y']):
+            if panel == 'hawaii':
+                labels[abbr] = ax_hi.text(x, y, abbr, fontsize=8, color='black', ha='center', va='center')
+            elif abbr in LABEL_OFFSETS:
+                dx, dy = LABEL_OFFSETS[abbr]
+                labels[abbr] = ax_main.annotate(
+                    abbr,
+                    xy=(x, y),
+                    xytext=(x + dx, y + dy),
+                    fontsize=8,
+                    color='black',
+                    ha='left', va='center',
+                    arrowprops=dict(arrowstyle='->', color='black', lw=0.5)
+                )
+            else:
+                labels[abbr] = ax_main.text(x, y, abbr, fontsize=8, color='black', ha='center', va='center')
+
+        # Step 4: Add the title and a colorbar on the left
+        title = ax_main.set_title('', fontsize=12)
+        divider = make_axes_locatable(ax_main)
+        cax = divider.append_axes("left", size="0.5%", pad=0.1)
+        sm = plt.cm.ScalarMappable(cmap=cmap, norm=norm)
+        sm.set_array([])
+        cbar = fig.colorbar(sm, cax=cax)
+        cbar.set_label('Grant per Student', rotation=270, labelpad=12)
+        plt.subplots_adjust(left=0.01, right=0.99, top=0.97, bottom=0)
+
+        # Step 5: Crop the figure once, with the longest title and every label shown
+        title.set_text(max([str(export_name) for _, _, export_name in self.jobs], key=len, default=''))
+        self._crop(fig)
+
+        return {'fig': fig, 'collections': collections, 'labels': labels, 'title': title, 'sm': sm, 'cax': cax,
+                'label_layers': {}}
+
+    def _label_layer(self, template, shown):
+        """
+        Renders the labels (and arrows) of the shown states alone on a transparent canvas and returns the pixels they cover,
+        as (row, column) indices and their RGBA values. The labels do not change between jobs with the same states,
+        so each set of shown states is rendered once and _draw blends the covered pixels instead of drawing the labels.
+
+        template: template returned by _template
+        shown: tuple of the abbreviations of the states with data
+        """
+        if shown not in template['label_layers']:
+            fig = template['fig']
+            others = [collection for collection, _ in template['collections']] + [template['title'], template['cax']]
+            for abbr, label in template['labels'].items():
+                label.set_visible(abbr in shown)
+            for artist in others:
+                artist.set_visible(False)
+            alpha = fig.patch.get_alpha()
+            fig.patch.set_alpha(0)
+            fig.canvas.draw()
+            layer = np.asarray(fig.canvas.buffer_rgba())
+            covered = np.nonzero(layer[..., 3])
+            template['label_layers'][shown] = (covered, layer[covered])
+            fig.patch.set_alpha(alpha)
+            for artist in others:
+                artist.set_visible(True)
+        return template['label_layers'][shown]
+
+    @traced('map_draw', rows_in=lambda self, template, data, col, export_name: data,
+            attrs=lambda self, template, data, col, export_name: {'export_name': export_name})
+    def _draw(self, template, data, col, export_name):
+        """
+        Updates the template for one job (face colors, color scale, visible states and title) and saves it.
+        States without data are hidden, as MapMaker does not draw them.
+        A PNG is one Agg render of the artists that change between jobs (patches, color scale, title) on the cropped
+        figure, with the pre-rendered labels blended on top, written straight from the canvas buffer.
+        """
+        # Step 1: Align the data with the state patches
+        values = data.assign(stabbr=data['stabbr'].astype(str)).drop_duplicates('stabbr').set_index('stabbr')[col]
+        present = values.dropna()
+        vmin, vmax = present.min(), present.max()
+
+        # Step 2: Update face colors, edges and the shared color scale
+        for collection, abbrs in template['collections']:
+            state_values = values.reindex(abbrs).to_numpy(dtype='float64')
+            has_data = ~np.isnan(state_values)
+            collection.set_array(state_values)
+            collection.set_clim(vmin, vmax)
+            collection.set_edgecolor([(0.8, 0.8, 0.8, 1.0) if flag else (0, 0, 0, 0) for flag in has_data])
+        template['sm'].set_clim(vmin, vmax)
+
+        # Step 3: Set the title; labels are shown for states with data
+        template['title'].set_text(f'{export_name}')
+        shown = tuple(abbr for abbr in template['labels'] if abbr in present.index)
+
+        # Step 4: Save at 300 dpi; the figure is already cropped by _template
+        fig = template['fig']
+        output_dir = self.output_dir or os.path.join(os.getcwd(), 'Figure')
+        fig_path = os.path.join(output_dir, f'{export_name}.{self.file_format}')
+        if self.file_format == 'png':
+            covered, label_pixels = self._label_layer(template, shown)
+            for label in template['labels'].values():
+                label.set_visible(False)
+            fig.canvas.draw()
+            canvas = np.asarray(fig.canvas.buffer_rgba())
+            height, width, _ = canvas.shape
+            rows = np.empty((height, 1 + 4 * width), dtype=np.uint8)
+            rows[:, 0] = 0
+            image = rows[:, 1:].reshape(height, width, 4)
+            image[...] = canvas
+            # Blend the labels over the drawn map as Agg would have drawn them
+            alpha = label_pixels[:, 3:].astype(np.uint16)
+            image[covered[0], covered[1], :3] = (label_pixels[:, :3] * alpha + image[covered[0], covered[1], :3] * (255 - alpha)
+                                                 + 127) // 255
+            self._write_png(fig_path, rows)
+        else:
+            for abbr, label in template['labels'].items():
+                label.set_visible(abbr in shown)
+            fig.savefig(fig_path, dpi=300)
+        return fig_path
+
+    def _render(self):
+        """
+        Renders every job and returns the paths of the saved figures, in job order.
+        With n_jobs > 1 the jobs are split into contiguous chunks, each rendered by a worker process on its own template;
+        fewer workers are started if some would get less than MIN_JOBS_PER_WORKER jobs, since they could not pay back their template.
+        """
+        n_chunks = min(self.n_jobs, len(self.jobs) // MIN_JOBS_PER_WORKER)
+        if n_chunks > 1:
+            bounds = np.linspace(0, len(self.jobs), n_chunks + 1).astype(int)
+            chunks = [MapBatch(self.jobs[lo:hi], 1, self.shapefile_path, self.cache_dir, self.tolerance, self.file_format,
+                               self.tracer, self.output_dir)
+                      for lo, hi in zip(bounds[:-1], bounds[1:])]
+            # Build the base layer before forking, so workers find it in the on-disk cache
+            MapMaker(None, None, None, self.shapefile_path, self.cache_dir)._base_layer(self.tolerance)
+            with ProcessPoolExecutor(max_workers=n_chunks) as pool:
+                rendered = []
+                for paths, spans in pool.map(_render_chunk, chunks):
+                    self.tracer._attach(spans)
+                    rendered.extend(paths)
+                return rendered
+
+        template = self._template()
+        try:
+            return [self._draw(template, data, col, export_name) for data, col, export_name in self.jobs]
+        finally:
+            plt.close(template['fig'])
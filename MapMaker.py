@@ -1,50 +1,184 @@
 import os
+import hashlib
 import pandas as pd
 import numpy as np
 import geopandas as gpd
+import shapely
 import matplotlib.pyplot as plt
 from matplotlib.gridspec import GridSpec
 from shapely.affinity import scale, translate
 from mpl_toolkits.axes_grid1 import make_axes_locatable
+from Tracer import Tracer, traced
+from PanelIndex import PanelIndex
+
+# U.S. shape file (Downloaded from https://www2.census.gov/geo/tiger/GENZ2018/shp/cb_2018_us_state_20m.zip)
+SHAPEFILE_PATH = './cb_2018_us_state_20m/cb_2018_us_state_20m.shp'
+STATE_LIST = [
+    'AL', 'AK', 'AZ', 'AR', 'CA', 'CO', 'CT', 'DE', 'FL', 'GA',
+    'HI', 'ID', 'IL', 'IN', 'IA', 'KS', 'KY', 'LA', 'ME', 'MD',
+    'MA', 'MI', 'MN', 'MS', 'MO', 'MT', 'NE', 'NV', 'NH', 'NJ',
+    'NM', 'NY', 'NC', 'ND', 'OH', 'OK', 'OR', 'PA', 'RI', 'SC',
+    'SD', 'TN', 'TX', 'UT', 'VT', 'VA', 'WA', 'WV', 'WI', 'WY'
+]
+# Output formats: PNG is rasterized at 300 dpi, SVG and PDF keep the polygons as vectors
+FILE_FORMATS = ('png', 'svg', 'pdf')
+# Small northeastern states are labelled off the map with an arrow
+LABEL_OFFSETS = {
+    'RI': (1.5, -0.5),
+    'CT': (1.2, -1),
+    'DE': (1.2, -1.2),
+    'MD': (1.8, 0),
+    'NJ': (1.5, 0.2),
+    'MA': (1.5, 1),
+    'VT': (1.5, 1.5),
+    'NH': (1.8, 0.9),
+}
 
 class MapMaker():
-    def __init__(self, data, col, export_name):
+    # Processed base layers already built in this process, keyed by shapefile hash
+    _base_layers = {}
+    # Shapefile hashes already computed in this process, keyed by (path, size, mtime)
+    _hashes = {}
+
+    def __init__(self, data, col, export_name, shapefile_path=SHAPEFILE_PATH, cache_dir=os.path.join("Cache", "map"),
+                 tolerance=None, file_format='png', tracer=None, year=None, output_dir=None):
         """
-        data: a DataFrame with 'stabbr', 'year' and data needed to visualize on the map
+        data: a DataFrame with 'stabbr', 'year' and data needed to visualize on the map,
+              or a PanelIndex of state-level data over several years, from which the rows of one year are sliced
         col: the specific column name of data to visualize
         export_name: exporting name of the image
+        shapefile_path: path to the U.S. state shapefile
+        cache_dir: folder where the processed base layer is persisted between runs
+        tolerance: level of detail, as a simplification tolerance in degrees (None keeps the full 20m resolution;
+                   e.g. 0.01 for publication figures, 0.05-0.2 for thumbnails and dashboards)
+        file_format: 'png' (300 dpi raster), or 'svg' / 'pdf' for compact vector output
+        tracer: Tracer recording the time and memory of each render and base layer load (None for no tracing)
+        year: year to map when data is a PanelIndex (None for its last year)
+        output_dir: folder the image is saved to (None for the Figure folder of the working directory)
         """
+        if file_format not in FILE_FORMATS:
+            raise ValueError(f"file_format must be one of {FILE_FORMATS}.")
         self.data = data
         self.col = col
         self.export_name = export_name
-        
-    def _map_figure(self):
+        self.shapefile_path = shapefile_path
+        self.cache_dir = cache_dir
+        self.tolerance = tolerance
+        self.file_format = file_format
+        self.tracer = tracer or Tracer()
+        self.year = year
+        self.output_dir = output_dir
+
+    def _shapefile_hash(self):
+        """
+        Hashes the contents of the shapefile and its companion files (.shx, .dbf, .prj), which together define the geometry.
+        """
+        stem = os.path.splitext(self.shapefile_path)[0]
+        paths = [stem + ext for ext in ['.shp', '.shx', '.dbf', '.prj'] if os.path.exists(stem + ext)]
+        key = tuple((path, os.path.getsize(path), os.path.getmtime(path)) for path in paths)
+        if key not in MapMaker._hashes:
+            h = hashlib.sha256()
+            for path in paths:
+                with open(path, 'rb') as f:
+                    h.update(f.read())
+            MapMaker._hashes[key] = h.hexdigest()[:16]
+        return MapMaker._hashes[key]
+
+    def _build_base_layer(self):
         """
-        Visualizes the data on the map
+        Reads the shapefile and prepares the 50-state base layer: Alaska is resized and moved to fit within the figure,
+        each state is tagged with its panel ('mainland', 'alaska' or 'hawaii'), and label positions are precomputed.
         """
-        # Step 1: Import U.S. shape file (Downloaded from https://www2.census.gov/geo/tiger/GENZ2018/shp/cb_2018_us_state_20m.zip)
-        shapefile_path = './cb_2018_us_state_20m/cb_2018_us_state_20m.shp'
-        states = gpd.read_file(shapefile_path)
-        state_list = [
-            'AL', 'AK', 'AZ', 'AR', 'CA', 'CO', 'CT', 'DE', 'FL', 'GA',
-            'HI', 'ID', 'IL', 'IN', 'IA', 'KS', 'KY', 'LA', 'ME', 'MD',
-            'MA', 'MI', 'MN', 'MS', 'MO', 'MT', 'NE', 'NV', 'NH', 'NJ',
-            'NM', 'NY', 'NC', 'ND', 'OH', 'OK', 'OR', 'PA', 'RI', 'SC',
-            'SD', 'TN', 'TX', 'UT', 'VT', 'VA', 'WA', 'WV', 'WI', 'WY'
-        ]
-        states = states[states['STUSPS'].isin(state_list)]
-        states = states.merge(self.data, left_on='STUSPS', right_on='stabbr')
-
-        mainland = states[~states['STUSPS'].isin(['AK', 'HI'])]
-        alaska = states[states['STUSPS'] == 'AK']
-        hawaii = states[states['STUSPS'] == 'HI']
+        # Step 1: Keep the 50 states
+        states = gpd.read_file(self.shapefile_path)
+        states = states[states['STUSPS'].isin(STATE_LIST)][['STUSPS', 'geometry']].reset_index(drop=True)
 
         # Step 2: Resize the Alaska map to fit within the overall figure
-        alaska = alaska.copy()
-        alaska['geometry'] = alaska['geometry'].apply(lambda geom: scale(geom, xfact=0.2, yfact=0.2, origin='center'))
-        alaska['geometry'] = alaska['geometry'].apply(lambda geom: translate(geom, xoff=-100, yoff=-10))
+        is_alaska = (states['STUSPS'] == 'AK').to_numpy()
+        states.loc[is_alaska, 'geometry'] = states.loc[is_alaska, 'geometry'].apply(
+            lambda geom: translate(scale(geom, xfact=0.2, yfact=0.2, origin='center'), xoff=-100, yoff=-10)
+        )
+
+        # Step 3: Tag panels and precompute label positions
+        states['panel'] = np.where(is_alaska, 'alaska', np.where(states['STUSPS'] == 'HI', 'hawaii', 'mainland'))
+        centroids = states['geometry'].apply(lambda geom: geom.centroid.coords[0])
+        states['label_x'] = [x for x, _ in centroids]
+        states['label_y'] = [y for _, y in centroids]
+        return states
+
+    def _simplify(self, base, tolerance):
+        """
+        Simplifies the state polygons as one coverage, so that borders shared by neighbouring states are simplified
+        identically and no gaps or overlaps appear. Label positions are kept from the full-resolution layer.
+        Falls back to per-state topology-preserving simplification if shapely lacks coverage_simplify (shapely < 2.1).
+
+        base: full-resolution base layer
+        tolerance: simplification tolerance in degrees
+        """
+        simplified = base.copy()
+        if hasattr(shapely, 'coverage_simplify'):
+            simplified['geometry'] = shapely.coverage_simplify(base['geometry'].to_numpy(), tolerance)
+        else:
+            print("Warning: shapely.coverage_simplify is unavailable; shared state borders may not line up after simplification.")
+            simplified['geometry'] = base['geometry'].simplify(tolerance, preserve_topology=True)
+        return simplified
+
+    def _map_data(self):
+        """
+        Returns the state-level rows to map: data itself, or the slice of the mapped year of a PanelIndex.
+        """
+        if isinstance(self.data, PanelIndex):
+            return self.data._year(self.data.years[-1] if self.year is None else self.year)
+        return self.data
+
+    @traced('base_layer', attrs=lambda self, tolerance=None: {'tolerance': tolerance})
+    def _base_layer(self, tolerance=None):
+        """
+        Returns the processed base layer at the given level of detail, from the in-process cache, the on-disk cache,
+        or by building it from the shapefile (and simplifying it once per tolerance).
+        Both caches are keyed by the shapefile hash and the tolerance, so editing the shapefile invalidates them.
+
+        tolerance: simplification tolerance in degrees (None for full resolution)
+        """
+        shp_hash = self._shapefile_hash()
+        key = shp_hash if tolerance is None else f"{shp_hash}_tol{tolerance:g}"
+        if key in MapMaker._base_layers:
+            return MapMaker._base_layers[key]
+
+        cache_path = os.path.join(self.cache_dir, f"base_{key}.pkl")
+        base = None
+        if os.path.exists(cache_path):
+            try:
+                base = pd.read_pickle(cache_path)
+            except Exception:
+                base = None
+        if base is None:
+            if tolerance is None:
+                base = self._build_base_layer()
+            else:
+                base = self._simplify(self._base_layer(), tolerance)
+            try:
+                os.makedirs(self.cache_dir, exist_ok=True)
+                base.to_pickle(cache_path)
+            except OSError as e:
+                print(f"Warning: could not cache the map base layer in {cache_path}: {e}")
+
+        MapMaker._base_layers[key] = base
+        return base
+
+    @traced('map_figure', rows_in=lambda self: self.data, attrs=lambda self: {'export_name': self.export_name})
+    def _map_figure(self):
+        """
+        Visualizes the data on the map and returns the path of the saved image
+        """
+        # Step 1: Join the data onto the cached base layer (filtered states, resized Alaska, label positions)
+        states = self._base_layer(self.tolerance).merge(self._map_data(), left_on='STUSPS', right_on='stabbr')
+
+        mainland = states[states['panel'] == 'mainland']
+        alaska = states[states['panel'] == 'alaska']
+        hawaii = states[states['panel'] == 'hawaii']
 
-        # Step 3: Visualize the data on the map using a color scale
+        # Step 2: Visualize the data on the map using a color scale
         vmin, vmax = states[self.col].min(), states[self.col].max()
         norm = plt.Normalize(vmin=vmin, vmax=vmax)
         fig = plt.figure(figsize=(24, 6))
@@ -59,25 +193,13 @@ class MapMaker():
         alaska.plot(column=self.col, cmap='RdYlBu_r', linewidth=0.8, edgecolor='0.8', 
                     ax=ax_main, norm=norm)
         
-        # Step 4: Add title and state abbreviations to the map
+        # Step 3: Add title and state abbreviations to the map, using the precomputed label positions
         ax_main.set_title(f'{self.export_name}', fontsize=12)
         ax_main.axis('off')
 
-        offsets = {
-            'RI': (1.5, -0.5),
-            'CT': (1.2, -1),
-            'DE': (1.2, -1.2),
-            'MD': (1.8, 0),
-            'NJ': (1.5, 0.2),
-            'MA': (1.5, 1),
-            'VT': (1.5, 1.5),
-            'NH': (1.8, 0.9),
-        }
-        for idx, row in mainland.iterrows():
-            abbr = row['STUSPS']
-            x, y = row['geometry'].centroid.coords[0]
-            if abbr in offsets:
-                dx, dy = offsets[abbr]
+        for abbr, x, y in zip(mainland['STUSPS'], mainland['label_x'], mainland['label_y']):
+            if abbr in LABEL_OFFSETS:
+                dx, dy = LABEL_OFFSETS[abbr]
                 ax_main.annotate(
                     abbr,
                     xy=(x, y),
@@ -90,15 +212,13 @@ class MapMaker():
             else:
                 ax_main.text(x, y, abbr, fontsize=8, color='black', ha='center', va='center')
 
-        for idx, row in alaska.iterrows():
-            x, y = row['geometry'].centroid.coords[0]
-            ax_main.text(x, y, row['STUSPS'], fontsize=8, color='black', ha='center', va='center')
+        for abbr, x, y in zip(alaska['STUSPS'], alaska['label_x'], alaska['label_y']):
+            ax_main.text(x, y, abbr, fontsize=8, color='black', ha='center', va='center')
 
-        for idx, row in hawaii.iterrows():
-            x, y = row['geometry'].centroid.coords[0]
-            ax_hi.text(x, y, row['STUSPS'], fontsize=8, color='black', ha='center', va='center')
+        for abbr, x, y in zip(hawaii['STUSPS'], hawaii['label_x'], hawaii['label_y']):
+            ax_hi.text(x, y, abbr, fontsize=8, color='black', ha='center', va='center')
 
-        # Step 5: Add a colorbar on the left to indicate the data values, and save the entire figure
+        # Step 4: Add a colorbar on the left to indicate the data values, and save the entire figure
         divider = make_axes_locatable(ax_main)
         cax = divider.append_axes("left", size="0.5%", pad=0.1)
         sm = plt.cm.ScalarMappable(cmap='RdYlBu_r', norm=norm)
@@ -106,6 +226,9 @@ class MapMaker():
         cbar = fig.colorbar(sm, cax=cax)
         cbar.set_label('Grant per Student', rotation=270, labelpad=12)
         plt.subplots_adjust(left=0.01, right=0.99, top=0.97, bottom=0)
-        fig_path = os.path.join(os.getcwd(), 'Figure', f'{self.export_name}.png')
+        output_dir = self.output_dir or os.path.join(os.getcwd(), 'Figure')
+        fig_path = os.path.join(output_dir, f'{self.export_name}.{self.file_format}')
         plt.savefig(fig_path, dpi=300, bbox_inches='tight')
-        #plt.show()
\ No newline at end of file
+        #plt.show()
+        plt.close(fig)
+        return fig_path
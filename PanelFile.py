@@ -0,0 +1,110 @@
+import os
+import json
+import numpy as np
+import pandas as pd
+
+# Storage dtypes of the cleaned panel columns; other columns keep their own numeric dtype or are stored as categories
+CLEAN_DTYPES = {
+    'ID_IPEDS': 'int32',
+    'stabbr': 'category',
+    'highest_degree': 'int8',
+    'degree_bach': 'uint8',
+    'public': 'uint8',
+    'enroll_ftug': 'int32',
+    'grant_federal': 'float64',
+    'year': 'int16'
+}
+
+class PanelFile():
+    # Memory maps already opened in this process, keyed by path, so that every stage shares the same mapped files
+    _maps = {}
+
+    def __init__(self, path):
+        """
+        path: directory holding the panel in binary form, one .npy file per column plus a meta.json describing the columns
+        """
+        self.path = path
+        self.meta_path = os.path.join(path, "meta.json")
+
+    def _write(self, panel_data):
+        """
+        Writes a cleaned panel with compact dtypes. Integer columns with missing values get a separate boolean mask file,
+        and text columns are stored as integer category codes.
+
+        panel_data: a DataFrame, typically the output of DataProcessor._data_cleaner
+        """
+        os.makedirs(self.path, exist_ok=True)
+        columns = []
+        for col in panel_data.columns:
+            s = panel_data[col]
+            dtype = CLEAN_DTYPES.get(col)
+            if dtype is None:
+                dtype = str(s.dtype.numpy_dtype) if hasattr(s.dtype, 'numpy_dtype') else str(s.dtype)
+                if not pd.api.types.is_numeric_dtype(s) or pd.api.types.is_bool_dtype(s):
+                    dtype = 'category'
+            entry = {'name': col, 'dtype': dtype}
+
+            # Step 1: Text columns become category codes of the smallest integer type
+            if dtype == 'category':
+                cat = s.astype('category')
+                categories = cat.cat.categories
+                code_dtype = np.int8 if len(categories) < 2**7 else np.int16 if len(categories) < 2**15 else np.int32
+                values = cat.cat.codes.to_numpy().astype(code_dtype)
+                entry['categories'] = [str(c) for c in categories]
+
+            # Step 2: Integer columns store missing values in a separate mask
+            elif np.dtype(dtype).kind in 'iu':
+                missing = s.isna().to_numpy(dtype=bool)
+                filled = s.to_numpy(dtype='float64', na_value=0)
+                info = np.iinfo(dtype)
+                if len(filled) and (filled.min() < info.min or filled.max() > info.max or (filled % 1 != 0).any()):
+                    raise ValueError(f"Column '{col}' does not fit in {dtype}.")
+                values = filled.astype(dtype)
+                if missing.any():
+                    np.save(os.path.join(self.path, f"{col}.mask.npy"), missing)
+                    entry['mask'] = True
+
+            # Step 3: Float columns keep NaN as is
+            else:
+                values = s.to_numpy(dtype=dtype, na_value=np.nan)
+
+            np.save(os.path.join(self.path, f"{col}.npy"), values)
+            columns.append(entry)
+
+        # The manifest is written last, so a partly written directory is never read as complete
+        tmp_path = f"{self.meta_path}.{os.getpid()}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump({'n_rows': len(panel_data), 'columns': columns}, f)
+        os.replace(tmp_path, self.meta_path)
+        PanelFile._maps.pop(os.path.abspath(self.path), None)
+
+    def _read(self):
+        """
+        Opens the panel as a DataFrame whose columns are read-only memory maps of the .npy files (no text parsing, no copy).
+        Repeated calls in the same process reuse the memory maps until the files are rewritten, but each returns
+        a new DataFrame, so a caller adding or replacing columns does not change the panel other callers see.
+        """
+        # Step 1: Open the memory maps once per version of the files
+        key = os.path.abspath(self.path)
+        mtime = os.path.getmtime(self.meta_path)
+        if key not in PanelFile._maps or PanelFile._maps[key][0] != mtime:
+            with open(self.meta_path, encoding='utf-8') as f:
+                meta = json.load(f)
+            maps = []
+            for entry in meta['columns']:
+                col = entry['name']
+                values = np.load(os.path.join(self.path, f"{col}.npy"), mmap_mode='r')
+                mask = np.load(os.path.join(self.path, f"{col}.mask.npy"), mmap_mode='r') if entry.get('mask') else None
+                maps.append((entry, values, mask))
+            PanelFile._maps[key] = (mtime, maps)
+
+        # Step 2: Wrap them in a new DataFrame
+        data = {}
+        for entry, values, mask in PanelFile._maps[key][1]:
+            if entry['dtype'] == 'category':
+                data[entry['name']] = pd.Categorical.from_codes(values, categories=entry['categories'])
+            elif mask is not None:
+                data[entry['name']] = pd.arrays.IntegerArray(values, mask)
+            else:
+                data[entry['name']] = values
+        return pd.DataFrame(data, copy=False)
@@ -0,0 +1,138 @@
+import numpy as np
+import pandas as pd
+
+# Sort keys of the panel; ID_IPEDS is optional, so state-level panels (e.g. aggregated grants by year and state) can be indexed too
+INDEX_KEYS = ['year', 'stabbr', 'ID_IPEDS']
+
+class PanelIndex():
+    def __init__(self, panel_data):
+        """
+        Sorts a panel by (year, stabbr, ID_IPEDS) once and precomputes offset indexes, so that the rows of a year or of
+        a year x state cell are a contiguous slice found in O(1). The rows of a state or an institution are contiguous slices
+        of copies of the panel sorted by state or by institution, each built on its first lookup, found in O(1) and O(log n).
+
+        panel_data: a DataFrame with 'year' and 'stabbr' columns, typically the output of DataProcessor._data_cleaner
+        """
+        keys = [key for key in INDEX_KEYS if key in panel_data.columns]
+        if keys[:2] != ['year', 'stabbr']:
+            raise ValueError("panel_data must have 'year' and 'stabbr' columns.")
+
+        # Step 1: Encode years and states as dense codes and sort the rows once
+        self.years, year_codes = np.unique(panel_data['year'].to_numpy(), return_inverse=True)
+        states = pd.Categorical(panel_data['stabbr'].astype(str))
+        self.states = np.asarray(states.categories)
+        state_codes = states.codes.astype(np.int64)
+        sort_keys = [state_codes, year_codes]
+        if 'ID_IPEDS' in keys:
+            sort_keys.insert(0, panel_data['ID_IPEDS'].to_numpy())
+        order = np.lexsort(sort_keys)
+        self.data = panel_data.take(order).reset_index(drop=True)
+        year_codes = year_codes[order]
+        state_codes = state_codes[order]
+
+        # Step 2: Offsets of every year x state cell, in the style of a CSR index pointer:
+        # the rows of cell (y, s) are offsets[y * n_states + s] to offsets[y * n_states + s + 1]
+        n_states = len(self.states)
+        cells = year_codes * n_states + state_codes
+        self.offsets = np.searchsorted(cells, np.arange(len(self.years) * n_states + 1))
+
+        # Step 3: Secondary layouts for lookups that are not contiguous in the main order, built by _by_state and _by_institution
+        self._has_ids = 'ID_IPEDS' in keys
+        self._state_layout = None
+        self._id_layout = None
+
+    def __len__(self):
+        return len(self.data)
+
+    def _year_code(self, year):
+        """
+        Returns the position of a year among the indexed years, or None if it is not in the panel.
+        """
+        i = np.searchsorted(self.years, year)
+        return i if i < len(self.years) and self.years[i] == year else None
+
+    def _state_code(self, stabbr):
+        """
+        Returns the position of a state abbreviation among the indexed states, or None if it is not in the panel.
+        """
+        i = np.searchsorted(self.states, stabbr)
+        return i if i < len(self.states) and self.states[i] == stabbr else None
+
+    def _year(self, year):
+        """
+        Returns the rows of one year as a slice of the sorted panel (empty if the year is not in the panel).
+        """
+        y = self._year_code(year)
+        if y is None:
+            return self.data.iloc[0:0]
+        n_states = len(self.states)
+        return self.data.iloc[self.offsets[y * n_states]:self.offsets[(y + 1) * n_states]]
+
+    def _year_state(self, year, stabbr):
+        """
+        Returns the rows of one state in one year as a slice of the sorted panel.
+        """
+        y, s = self._year_code(year), self._state_code(stabbr)
+        if y is None or s is None:
+            return self.data.iloc[0:0]
+        cell = y * len(self.states) + s
+        return self.data.iloc[self.offsets[cell]:self.offsets[cell + 1]]
+
+    def _year_states(self, year, states):
+        """
+        Returns the rows of several states in one year, gathered from their cells (replaces an isin scan over the panel).
+        Cells of states that are not adjacent in the sorted order are not contiguous, so the rows are an O(k) copy
+        (k the number of rows returned), unless the cells form a single run, which is returned as a slice.
+        """
+        y = self._year_code(year)
+        codes = [self._state_code(stabbr) for stabbr in states]
+        cells = [y * len(self.states) + s for s in codes if s is not None] if y is not None else []
+        if not cells:
+            return self.data.iloc[0:0]
+        cells = np.unique(cells)
+        if cells[-1] - cells[0] == len(cells) - 1:
+            return self.data.iloc[self.offsets[cells[0]]:self.offsets[cells[-1] + 1]]
+        rows = np.concatenate([np.arange(self.offsets[cell], self.offsets[cell + 1]) for cell in cells])
+        return self.data.take(rows)
+
+    def _by_state(self):
+        """
+        Returns a copy of the panel sorted by (stabbr, year, ID_IPEDS) and the offsets of each state in it,
+        built on the first state lookup.
+        """
+        if self._state_layout is None:
+            state_codes = pd.Categorical(self.data['stabbr'].astype(str), categories=self.states).codes
+            order = np.argsort(state_codes, kind='stable')
+            offsets = np.searchsorted(state_codes[order], np.arange(len(self.states) + 1))
+            self._state_layout = (self.data.take(order).reset_index(drop=True), offsets)
+        return self._state_layout
+
+    def _by_institution(self):
+        """
+        Returns a copy of the panel sorted by (ID_IPEDS, year) and its sorted IDs, built on the first institution lookup.
+        """
+        if self._id_layout is None:
+            ids = self.data['ID_IPEDS'].to_numpy()
+            order = np.argsort(ids, kind='stable')
+            self._id_layout = (self.data.take(order).reset_index(drop=True), ids[order])
+        return self._id_layout
+
+    def _state(self, stabbr):
+        """
+        Returns the rows of one state over all years, in year order, as a slice of the state-sorted copy.
+        """
+        s = self._state_code(stabbr)
+        if s is None:
+            return self.data.iloc[0:0]
+        data, offsets = self._by_state()
+        return data.iloc[offsets[s]:offsets[s + 1]]
+
+    def _institution(self, unitid):
+        """
+        Returns the rows of one institution over all years, in year order, as a slice of the institution-sorted copy.
+        """
+        if not self._has_ids:
+            raise ValueError("The panel has no 'ID_IPEDS' column.")
+        data, ids = self._by_institution()
+        lo, hi = np.searchsorted(ids, unitid, side='left'), np.searchsorted(ids, unitid, side='right')
+        return data.iloc[lo:hi]
@@ -0,0 +1,149 @@
+import numpy as np
+import pandas as pd
+from Tracer import Tracer, traced
+
+try:
+    from scipy import sparse, stats
+    HAS_SCIPY = True
+except ImportError:
+    HAS_SCIPY = False
+
+class PanelRegression():
+    def __init__(self, panel_data, y, x, entity='ID_IPEDS', time='year', cluster='stabbr', tol=1e-10, max_iter=1000,
+                 tracer=None):
+        """
+        Linear regression of y on x with entity and time fixed effects, estimated on the within-transformed panel.
+        The fixed effects are absorbed by demeaning with sparse group-indicator matrices (alternating projections,
+        which converge in one sweep on a balanced panel), so memory grows with the number of rows, not with the number of dummies.
+
+        panel_data: institution-year panel, typically the output of DataProcessor._data_cleaner
+        y: name of the dependent variable, e.g. 'grant_federal'
+        x: list of regressor names, e.g. ['enroll_ftug']
+        entity: column identifying the cross-sectional units (their fixed effects are absorbed)
+        time: column identifying the periods (their fixed effects are absorbed; None for entity effects only)
+        cluster: column the standard errors are clustered by (None for heteroskedasticity-robust standard errors)
+        tol: convergence tolerance of the demeaning, relative to the scale of each variable
+        max_iter: maximum number of demeaning sweeps on unbalanced panels
+        tracer: Tracer recording the time, memory and rows of the fit (None for no tracing)
+        """
+        if not HAS_SCIPY:
+            raise ImportError("PanelRegression requires scipy for sparse group-indicator matrices.")
+        self.panel_data = panel_data
+        self.y = y
+        self.x = list(x)
+        self.entity = entity
+        self.time = time
+        self.cluster = cluster
+        self.tol = tol
+        self.max_iter = max_iter
+        self.tracer = tracer or Tracer()
+
+    def _indicator(self, codes, n_groups):
+        """
+        Returns the sparse (rows x groups) indicator matrix of a grouping and the number of rows in each group.
+        """
+        n = len(codes)
+        matrix = sparse.csr_matrix((np.ones(n), (np.arange(n), codes)), shape=(n, n_groups))
+        return matrix, np.bincount(codes, minlength=n_groups)
+
+    def _sample(self):
+        """
+        Returns the estimation sample: rows with all variables present, without entities observed only once
+        (they are fully absorbed by their fixed effect and carry no information).
+        """
+        columns = [self.y, *self.x, self.entity] + [c for c in [self.time, self.cluster] if c is not None]
+        data = self.panel_data[list(dict.fromkeys(columns))]
+        data = data[data.notna().all(axis=1).to_numpy(dtype=bool)]
+        entity_codes, _ = pd.factorize(data[self.entity])
+        singleton = np.bincount(entity_codes)[entity_codes] == 1
+        return data[~singleton]
+
+    def _demean(self, values, groupings):
+        """
+        Removes the fixed effects from every column of values by alternating projections onto each grouping.
+        Returns the demeaned values and the number of sweeps.
+
+        values: array of shape (rows, columns)
+        groupings: list of (indicator matrix, group sizes) pairs
+        """
+        scale = np.maximum(np.abs(values).max(axis=0), 1.0)
+        for sweep in range(1, self.max_iter + 1):
+            previous = values
+            for matrix, sizes in groupings:
+                means = (matrix.T @ values) / sizes[:, None]
+                values = values - matrix @ means
+            if len(groupings) == 1 or np.max(np.abs(values - previous) / scale) < self.tol:
+                return values, sweep
+        print(f"Warning: fixed-effect demeaning did not converge in {self.max_iter} sweeps.")
+        return values, self.max_iter
+
+    @traced('panel_regression', rows_in=lambda self: self.panel_data)
+    def _fit(self):
+        """
+        Estimates the coefficients and their standard errors.
+        Returns a DataFrame indexed by regressor (coef, std_error, t, p_value, ci_lower, ci_upper) and a dict of fit statistics.
+        Clustered standard errors use the CR1 small-sample factor G/(G-1) * (N-1)/(N-K), with K the number of regressors
+        plus the absorbed year effects (institutions are nested within states, so their fixed effects are not counted,
+        but years cut across states), and G-1 degrees of freedom.
+        """
+        # Step 1: Estimation sample and group codes
+        data = self._sample()
+        n, k = len(data), len(self.x)
+        entity_codes, entities = pd.factorize(data[self.entity])
+        groupings = [self._indicator(entity_codes, len(entities))]
+        n_periods = 0
+        if self.time is not None:
+            time_codes, periods = pd.factorize(data[self.time])
+            groupings.append(self._indicator(time_codes, len(periods)))
+            n_periods = len(periods)
+
+        # Step 2: Within transformation of y and x together
+        values = data[[self.y, *self.x]].to_numpy(dtype='float64')
+        demeaned, sweeps = self._demean(values, groupings)
+        y, X = demeaned[:, 0], demeaned[:, 1:]
+
+        # Step 3: OLS on the demeaned data
+        XtX_inv = np.linalg.inv(X.T @ X)
+        beta = XtX_inv @ (X.T @ y)
+        resid = y - X @ beta
+
+        # Step 4: Clustered (or robust) covariance from the summed scores of each cluster
+        scores = X * resid[:, None]
+        if self.cluster is not None:
+            cluster_codes, clusters = pd.factorize(data[self.cluster])
+            n_clusters = len(clusters)
+            indicator, _ = self._indicator(cluster_codes, n_clusters)
+            cluster_scores = indicator.T @ scores
+            meat = cluster_scores.T @ cluster_scores
+            factor = n_clusters / (n_clusters - 1) * (n - 1) / (n - k - max(n_periods - 1, 0))
+            df = n_clusters - 1
+        else:
+            n_clusters = None
+            meat = scores.T @ scores
+            absorbed = len(entities) + max(n_periods - 1, 0)
+            df = n - k - absorbed
+            factor = n / df
+        cov = factor * XtX_inv @ meat @ XtX_inv
+
+        # Step 5: Coefficient table and fit statistics
+        std_error = np.sqrt(np.diag(cov))
+        t_stat = beta / std_error
+        critical = stats.t.ppf(0.975, df)
+        coefficients = pd.DataFrame({
+            'coef': beta,
+            'std_error': std_error,
+            't': t_stat,
+            'p_value': 2 * stats.t.sf(np.abs(t_stat), df),
+            'ci_lower': beta - critical * std_error,
+            'ci_upper': beta + critical * std_error
+        }, index=pd.Index(self.x, name='variable'))
+        fit = {
+            'n_obs': n,
+            'n_dropped': len(self.panel_data) - n,
+            'n_entities': len(entities),
+            'n_periods': n_periods,
+            'n_clusters': n_clusters,
+            'r2_within': 1 - resid @ resid / (y @ y) if y @ y > 0 else np.nan,
+            'sweeps': sweeps
+        }
+        return coefficients, fit
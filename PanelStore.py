@@ -0,0 +1,208 @@
+import os
+import json
+import hashlib
+import numpy as np
+import pandas as pd
+from DataCache import HAS_PARQUET
+
+# Bit 0 of an institution's year mask is this academic year; a uint64 mask covers 64 years
+MASK_BASE_YEAR = 1980
+
+class PanelStore():
+    def __init__(self, processor, store_dir=os.path.join("Cache", "panel")):
+        """
+        processor: DataProcessor holding the year range and cleaning criteria
+        store_dir: folder holding one Parquet partition per academic year, its rows passing each set of cleaning criteria,
+                   the per-institution year masks and a manifest
+        """
+        if not HAS_PARQUET:
+            raise ImportError("PanelStore requires pyarrow to read and write Parquet partitions.")
+        self.processor = processor
+        self.store_dir = store_dir
+        self.manifest_path = os.path.join(store_dir, "manifest.json")
+
+    def _partition_path(self, year):
+        """
+        Returns the path of the partition holding the merged HD/SFA data of one academic year.
+        """
+        return os.path.join(self.store_dir, f"panel_{year}.parquet")
+
+    def _fingerprint(self, year):
+        """
+        Identifies the raw HD and SFA files of an academic year by size and modification time (None if a file is missing).
+        """
+        fingerprint = []
+        for folder in self.processor._year_folders(year + 1):
+            csv_path = self.processor._csv_path(folder)
+            if not os.path.exists(csv_path):
+                return None
+            stat = os.stat(csv_path)
+            fingerprint.append([stat.st_size, stat.st_mtime])
+        return fingerprint
+
+    def _mask_key(self):
+        """
+        Identifies the row-level cleaning criteria (see DataProcessor._row_mask) the filtered partitions and year masks depend on.
+        """
+        criteria = [bool(self.processor.undergraduate_institutions), sorted(self.processor._exclude_list()),
+                    bool(self.processor.balanced_panel)]
+        return hashlib.sha1(json.dumps(criteria).encode('utf-8')).hexdigest()[:12]
+
+    def _mask_path(self, key):
+        """
+        Returns the path of the year-mask table for one set of cleaning criteria.
+        """
+        return os.path.join(self.store_dir, f"masks_{key}.parquet")
+
+    def _filtered_path(self, key, year):
+        """
+        Returns the path of the rows of one academic year passing one set of row-level cleaning criteria.
+        """
+        return os.path.join(self.store_dir, f"filtered_{key}_{year}.parquet")
+
+    def _read_manifest(self):
+        """
+        Reads the manifest recording which raw files each partition, each filtered partition and each mask bit were built from.
+        """
+        manifest = {}
+        if os.path.exists(self.manifest_path):
+            try:
+                with open(self.manifest_path, encoding='utf-8') as f:
+                    manifest = json.load(f)
+            except (OSError, ValueError):
+                pass
+        for section in ['partitions', 'filtered', 'masks']:
+            manifest.setdefault(section, {})
+        return manifest
+
+    def _write_manifest(self, manifest):
+        """
+        Atomically writes the manifest.
+        """
+        os.makedirs(self.store_dir, exist_ok=True)
+        tmp_path = f"{self.manifest_path}.{os.getpid()}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(manifest, f)
+        os.replace(tmp_path, self.manifest_path)
+
+    def _year_bit(self, year):
+        """
+        Returns the mask bit of an academic year.
+        """
+        offset = year - MASK_BASE_YEAR
+        if not 0 <= offset < 64:
+            raise ValueError(f"year must be between {MASK_BASE_YEAR} and {MASK_BASE_YEAR + 63} to fit in the year mask.")
+        return np.uint64(1) << np.uint64(offset)
+
+    def _sync_partitions(self, manifest, years):
+        """
+        Loads, merges and stores only the years whose partition is missing or whose raw files changed.
+
+        manifest: current manifest, updated in place
+        years: academic years of the panel
+        """
+        stale = []
+        for year in years:
+            fingerprint = self._fingerprint(year)
+            if fingerprint is None or manifest['partitions'].get(str(year)) != fingerprint \
+                    or not os.path.exists(self._partition_path(year)):
+                stale.append(year)
+        if not stale:
+            return
+
+        # Missing files are reported (and stop the run) by the processor, exactly as in a full load
+        parts = self.processor._load_years([year + 1 for year in stale])
+        os.makedirs(self.store_dir, exist_ok=True)
+        for year, part in zip(stale, parts):
+            partition = self.processor._join_panel([part])
+            partition.to_parquet(self._partition_path(year), index=False)
+            manifest['partitions'][str(year)] = self._fingerprint(year)
+            print(f"Partition {year} stored with shape {partition.shape}")
+
+    def _sync_filtered(self, manifest, years):
+        """
+        Applies the row-level cleaning criteria to the partitions that changed since they were last filtered with them,
+        and stores the remaining rows, so that each year is filtered once per set of criteria.
+
+        manifest: current manifest, updated in place
+        years: academic years of the panel
+        """
+        key = self._mask_key()
+        built_from = manifest['filtered'].setdefault(key, {})
+        for year in years:
+            if built_from.get(str(year)) == manifest['partitions'][str(year)] and os.path.exists(self._filtered_path(key, year)):
+                continue
+            partition = self.processor._filter_rows(pd.read_parquet(self._partition_path(year)))
+            partition.to_parquet(self._filtered_path(key, year), index=False)
+            built_from[str(year)] = manifest['partitions'][str(year)]
+
+    def _sync_masks(self, manifest, years):
+        """
+        Updates the per-institution year masks for the current cleaning criteria, recomputing only the bits of
+        years whose partition changed since the masks were last built, from the IDs of their filtered partitions.
+        Returns the masks as a Series indexed by ID_IPEDS.
+
+        manifest: current manifest, updated in place
+        years: academic years of the panel
+        """
+        key = self._mask_key()
+        mask_path = self._mask_path(key)
+        built_from = manifest['masks'].get(key, {})
+        if os.path.exists(mask_path):
+            table = pd.read_parquet(mask_path)
+            ids = table['ID_IPEDS'].to_numpy()
+            masks = table['years_mask'].to_numpy().astype(np.uint64)
+        else:
+            built_from = {}
+            ids = np.empty(0, dtype=np.int32)
+            masks = np.empty(0, dtype=np.uint64)
+
+        stale = [year for year in years if built_from.get(str(year)) != manifest['partitions'][str(year)]]
+        for year in stale:
+            bit = self._year_bit(year)
+            partition = pd.read_parquet(self._filtered_path(key, year), columns=['ID_IPEDS'])
+            year_ids = np.unique(partition['ID_IPEDS'].to_numpy())
+
+            # Clear the year's bit, add newly seen institutions, then set the bit for institutions present this year
+            masks &= ~bit
+            new_ids = np.setdiff1d(year_ids, ids, assume_unique=True)
+            ids = np.concatenate([ids, new_ids.astype(ids.dtype)])
+            masks = np.concatenate([masks, np.zeros(len(new_ids), dtype=np.uint64)])
+            masks[np.isin(ids, year_ids)] |= bit
+            built_from[str(year)] = manifest['partitions'][str(year)]
+
+        if stale:
+            pd.DataFrame({'ID_IPEDS': ids, 'years_mask': masks}).to_parquet(mask_path, index=False)
+            manifest['masks'][key] = built_from
+        return pd.Series(masks, index=ids)
+
+    def _build(self):
+        """
+        Returns the cleaned panel for the processor's year range and criteria, equivalent to
+        processor._data_cleaner(processor._data_loader()). Only new or changed years are read from the raw files and filtered;
+        the other years are read back already filtered, and balanced-panel membership is derived from the stored
+        per-institution year masks.
+        """
+        years = list(range(self.processor.start, self.processor.end + 1))
+        manifest = self._read_manifest()
+
+        # Step 1: Bring the partitions and their filtered rows up to date
+        self._sync_partitions(manifest, years)
+        self._sync_filtered(manifest, years)
+
+        # Step 2: Bring the year masks up to date and find institutions present in every year
+        complete_ids = None
+        if self.processor.balanced_panel:
+            masks = self._sync_masks(manifest, years)
+            full = np.uint64(0)
+            for year in years:
+                full |= self._year_bit(year)
+            complete_ids = masks.index[(masks.to_numpy() & full) == full]
+        self._write_manifest(manifest)
+
+        # Step 3: Concatenate the filtered partitions and keep the balanced-panel institutions
+        key = self._mask_key()
+        panel_data = pd.concat([pd.read_parquet(self._filtered_path(key, year)) for year in years], ignore_index=True)
+        if complete_ids is not None:
+            panel_data = panel_data[panel_data['ID_IPEDS'].isin(complete_ids).to_numpy(dtype=bool)].reset_index(drop=True)
+        return panel_data
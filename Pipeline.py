@@ -0,0 +1,486 @@
+"""
+Stage graph of main.py with content-hash memoization.
+
+Each region of main.py is a stage function below. main.py calls them in order; running this file instead executes them as a
+graph: every stage's result is memoized under a hash of its parameters, its upstream results, its input files and its own code,
+so only stale stages run, and independent stages run concurrently with --n-jobs.
+
+Usage (from the repository root):
+    python Pipeline.py --formula 1750 0.15 --n-jobs 4
+"""
+import os
+import sys
+import json
+import pickle
+import hashlib
+import inspect
+import argparse
+import matplotlib.pyplot as plt
+import matplotlib.ticker as ticker
+from concurrent.futures import ProcessPoolExecutor, FIRST_COMPLETED, wait
+from DataProcessor import DataProcessor
+from DataAnalyzer import DataAnalyzer
+from DataCache import DataCache, HAS_PARQUET
+from MapMaker import MapMaker
+from ReportBatch import ReportBatch
+from PanelFile import PanelFile
+from PanelStore import PanelStore
+from Tracer import Tracer, TRACE_FORMATS
+
+DEFAULT_PARAMS = {
+    'start': 2010,
+    'end': 2015,
+    'balanced_panel': True,
+    'excluding_states': ['DC', 'FM', 'MH', 'MP', 'PR', 'PW', 'VI', 'GU', 'AS'],
+    'undergraduate_institutions': True,
+    'year': 2015,
+    'formula': [1750, 0.15],
+    'compare_states': ['NY', 'VT']
+}
+
+# Folder the panel stage exports clean_data.csv and its binary copy to (next to the modules, as DataProcessor._data_exporter does)
+PANEL_DIR = os.path.dirname(os.path.abspath(__file__))
+
+
+def academic_year(year):
+    """
+    Formats an academic year label, e.g. 2015 -> '2015-16'.
+    """
+    return f"{year}-{str(year + 1)[-2:]}"
+
+
+# region: 1 Assembling the Data
+def assemble_panel(start, end, balanced_panel, excluding_states, undergraduate_institutions, output_dir=PANEL_DIR,
+                   tracer=None):
+    """
+    Loads, cleans and exports the panel (clean_data.csv and its binary copy) to output_dir. Returns the path of the binary copy.
+    With pyarrow installed the panel is built by PanelStore, so a run after a new year is added to Raw Data only loads that year.
+    """
+    processor = DataProcessor(
+        start=start,
+        end=end,
+        balanced_panel=balanced_panel,
+        excluding_states=excluding_states,
+        undergraduate_institutions=undergraduate_institutions,
+        tracer=tracer
+    )
+    if HAS_PARQUET:
+        df = PanelStore(processor)._build()
+    else:
+        df = processor._data_loader()
+        df = processor._data_cleaner(panel_data = df)
+    processor._data_exporter(panel_data_clean = df, binary = True, output_dir = output_dir)
+    return os.path.join(output_dir, 'clean_data')
+# endregion
+
+
+# region: 2 Trend of enrollment
+def enrollment_trend(clean_path, output_dir=None):
+    """
+    Plots total enrollment at public two-year colleges by academic year.
+    Figures of this and the following stages are saved to output_dir (None for the Figure folder of the working directory).
+    """
+    df = PanelFile(clean_path)._read()
+    filtered_df = df[(df['highest_degree'].isin([1, 2, 3, 4])) & (df['public'] == 1)].copy()
+    enroll_by_year = filtered_df.groupby('year')['enroll_ftug'].sum().reset_index()
+    enroll_by_year['academic_year'] = enroll_by_year['year'].apply(lambda y: f"{y}-{str(y+1)[-2:]}")
+
+    plt.figure(figsize=(8, 5))
+    plt.plot(enroll_by_year['academic_year'], enroll_by_year['enroll_ftug'], marker='o', linestyle='-')
+    plt.title('Total number of students enrolled at all public, two-year colleges by Academic Year')
+    plt.xlabel('Academic Year')
+    plt.ylabel('Total number of students enrolled at all public, two-year colleges')
+    plt.gca().yaxis.set_major_formatter(ticker.StrMethodFormatter('{x:,.0f}'))
+    plt.grid(True)
+    plt.tight_layout()
+    plt.xticks(rotation=45)
+    # outout path
+    fig_path = os.path.join(output_dir or os.path.join(os.getcwd(), 'Figure'), 'public_two_year_colleges_enroll_by_year.png')
+    plt.savefig(fig_path, dpi=300, bbox_inches='tight')
+    #plt.show()
+    plt.close()
+# endregion
+
+
+# region: 3 Facts of financial aid
+def state_grants(clean_path, year, tracer=None):
+    """
+    Aggregates per-student federal grants by state for the given year.
+    """
+    df = PanelFile(clean_path)._read()
+    analyzer = DataAnalyzer(clean_data = df, year = year, formula = None, tracer = tracer)
+    return analyzer._aggregate_per_student_grant()
+
+
+def compare_states(state_data, year, selected_states, output_dir=None):
+    """
+    a) Compares per-student federal grants of the selected states with a bar chart.
+    """
+    filtered_data = state_data[state_data['stabbr'].isin(selected_states)]
+
+    # Code block for generating a bar chart
+    plt.figure(figsize=(5, 4))
+    bars = plt.bar(
+        filtered_data['stabbr'].astype(str),
+        filtered_data['per_student_federal_grant'],
+        color='gray'
+    )
+    plt.ylim(0, filtered_data['per_student_federal_grant'].max() * 1.5)
+    for bar in bars:
+        height = bar.get_height()
+        plt.text(
+            bar.get_x() + bar.get_width() / 2,
+            height + 50,
+            f'{height:,.2f}',
+            ha='center',
+            va='bottom',
+            color='black',
+            fontsize=11
+        )
+    plt.title(f"Per Student Federal Grant: {' vs '.join(selected_states)} ({academic_year(year)})")
+    plt.xlabel('State')
+    plt.ylabel('Per Student Federal Grant')
+    plt.tight_layout()
+    name = '_vs_'.join(state.lower() for state in selected_states)
+    fig_path = os.path.join(output_dir or os.path.join(os.getcwd(), 'Figure'), f'per_student_federal_grant_{name}.png')
+    plt.savefig(fig_path, dpi=300, bbox_inches='tight')
+    #plt.show()
+    plt.close()
+
+
+def summary_table(data, col, title, caption, file_name, tracer=None, output_dir=None):
+    """
+    b) and c) Produces descriptive statistics and regional mean/variance of a column, outputs LaTeX and a table figure.
+    """
+    analyzer = DataAnalyzer(clean_data = None, year = None, formula = None, tracer = tracer)
+    desc_stats, region_stats = analyzer._summary_statistics(data, col)
+
+    # The LaTeX code and the table figure are rendered by ReportBatch, which also renders many tables in one call
+    [(latex_code, _)] = ReportBatch([(desc_stats, region_stats, title, caption, file_name)], output_dir = output_dir,
+                                    tracer = tracer)._render()
+    print(latex_code)
+    return latex_code
+
+
+def grant_summary_table(state_data, year, tracer=None, output_dir=None):
+    """
+    b) Summary statistics of per-student federal grants across states.
+    """
+    return summary_table(state_data, 'per_student_federal_grant',
+                         title=f"Per-student Federal Grant {academic_year(year)}",
+                         caption="Descriptive Statistics and Regional Means and Variances",
+                         file_name='descriptive_statistics_table', tracer=tracer, output_dir=output_dir)
+
+
+def simulate(clean_path, year, formula, tracer=None):
+    """
+    c) Simulates per-student grants by state with the given formula.
+    """
+    df = PanelFile(clean_path)._read()
+    analyzer = DataAnalyzer(clean_data = df, year = year, formula = formula, tracer = tracer)
+    return analyzer._simulater()
+
+
+def simulated_summary_table(simulated_data, year, tracer=None, output_dir=None):
+    """
+    c) Summary statistics of simulated per-student grants across states.
+    """
+    return summary_table(simulated_data, 'grant_per_student_simulated',
+                         title=f"Grant per-student Simulated {academic_year(year)}",
+                         caption="Descriptive Statistics and Regional Means and Variances (Simulated)",
+                         file_name='descriptive_statistics_table (Simulated)', tracer=tracer, output_dir=output_dir)
+# endregion
+
+
+# region: 4 Visualize results in maps
+def grant_map(state_data, year, tracer=None, output_dir=None):
+    """
+    Maps actual per-student federal grants by state.
+    """
+    MapMaker(
+        data = state_data,
+        col = 'per_student_federal_grant',
+        export_name = f'Federal Grant per Student by State ({academic_year(year)})',
+        tracer = tracer,
+        output_dir = output_dir
+    )._map_figure()
+
+
+def simulated_map(simulated_data, year, tracer=None, output_dir=None):
+    """
+    Maps simulated per-student grants by state.
+    """
+    MapMaker(
+        data = simulated_data,
+        col = 'grant_per_student_simulated',
+        export_name = f'Grant per Student Simulated by State ({academic_year(year)})',
+        tracer = tracer,
+        output_dir = output_dir
+    )._map_figure()
+# endregion
+
+
+def _figure(name):
+    """
+    Returns the path of a figure written by a stage.
+    """
+    return os.path.join('Figure', name)
+
+
+# Stage graph: upstream stages (whose results are passed positionally, in order), parameters, the helpers and
+# library classes each stage runs besides its function (their code is part of the stage key),
+# and output files of each stage (a stage whose outputs are missing is re-run)
+STAGES = {
+    'panel': {'func': assemble_panel, 'deps': [],
+              'params': ['start', 'end', 'balanced_panel', 'excluding_states', 'undergraduate_institutions'],
+              'code': [DataProcessor, PanelStore],
+              'outputs': lambda p: [os.path.join(PANEL_DIR, 'clean_data.csv'),
+                                    os.path.join(PANEL_DIR, 'clean_data', 'meta.json')]},
+    'enrollment_trend': {'func': enrollment_trend, 'deps': ['panel'], 'params': [], 'code': [PanelFile],
+                         'outputs': lambda p: [_figure('public_two_year_colleges_enroll_by_year.png')]},
+    'state_grants': {'func': state_grants, 'deps': ['panel'], 'params': ['year'], 'code': [PanelFile, DataAnalyzer]},
+    'compare_states': {'func': compare_states, 'deps': ['state_grants'], 'params': ['year', 'compare_states'],
+                       'code': [academic_year],
+                       'rename': {'compare_states': 'selected_states'},
+                       'outputs': lambda p: [_figure('per_student_federal_grant_'
+                                                     + '_vs_'.join(s.lower() for s in p['compare_states']) + '.png')]},
+    'grant_summary_table': {'func': grant_summary_table, 'deps': ['state_grants'], 'params': ['year'],
+                            'code': [summary_table, academic_year, DataAnalyzer, ReportBatch],
+                            'outputs': lambda p: [_figure('descriptive_statistics_table.png')]},
+    'simulate': {'func': simulate, 'deps': ['panel'], 'params': ['year', 'formula'], 'code': [PanelFile, DataAnalyzer]},
+    'simulated_summary_table': {'func': simulated_summary_table, 'deps': ['simulate'], 'params': ['year'],
+                                'code': [summary_table, academic_year, DataAnalyzer, ReportBatch],
+                                'outputs': lambda p: [_figure('descriptive_statistics_table (Simulated).png')]},
+    'grant_map': {'func': grant_map, 'deps': ['state_grants'], 'params': ['year'], 'code': [academic_year, MapMaker],
+                  'outputs': lambda p: [_figure(f"Federal Grant per Student by State ({academic_year(p['year'])}).png")]},
+    'simulated_map': {'func': simulated_map, 'deps': ['simulate'], 'params': ['year'], 'code': [academic_year, MapMaker],
+                      'outputs': lambda p: [_figure(f"Grant per Student Simulated by State ({academic_year(p['year'])}).png")]}
+}
+
+
+def _run_stage(name, tracer, func, args, kwargs):
+    """
+    Runs one stage function in a worker process, when stages run concurrently.
+    Returns the stage result and the spans the worker recorded.
+    """
+    plt.switch_backend('Agg')
+    with tracer._span(name, stage=True):
+        result = func(*args, **kwargs)
+    return result, tracer._detach()
+
+
+class Pipeline():
+    def __init__(self, params=None, n_jobs=1, cache_dir=os.path.join("Cache", "pipeline"), tracer=None):
+        """
+        params: stage parameters, overriding DEFAULT_PARAMS (year range, cleaning criteria, analysis year, formula, compared states)
+        n_jobs: number of worker processes used to run independent stages concurrently (1 runs stages one by one)
+        cache_dir: folder holding the memoized stage results and the manifest of their keys
+        tracer: Tracer recording each executed stage and the steps inside it (None for no tracing)
+        """
+        self.params = dict(DEFAULT_PARAMS, **(params or {}))
+        # 1750 and 1750.0 are the same coefficient, so they must give the same stage key
+        self.params['formula'] = [float(coef) for coef in self.params['formula']]
+        self.n_jobs = n_jobs
+        self.cache_dir = cache_dir
+        self.manifest_path = os.path.join(cache_dir, "manifest.json")
+        self.tracer = tracer or Tracer()
+
+    def _input_hashes(self, name):
+        """
+        Hashes the external files a stage reads: the raw HD/SFA files of the panel years for 'panel', nothing otherwise.
+        Files whose size and modification time match their raw-cache entry are not read again (see DataCache._source_hash),
+        so a run with nothing stale does not rehash the raw data.
+        """
+        if name != 'panel':
+            return []
+        processor = DataProcessor(self.params['start'], self.params['end'], self.params['balanced_panel'],
+                                  self.params['excluding_states'], self.params['undergraduate_institutions'])
+        cache = DataCache()
+        hashes = []
+        for year in range(processor.start + 1, processor.end + 2):
+            for folder in processor._year_folders(year):
+                csv_path = processor._csv_path(folder)
+                hashes.append([csv_path, cache._source_hash(csv_path) if os.path.exists(csv_path) else None])
+        return hashes
+
+    def _code_hashes(self, name):
+        """
+        Hashes the code a stage runs: the source of its function and of the helpers of this module in its 'code' list,
+        and the contents of the module files of its library classes, with every module of this folder they import.
+        """
+        stage = STAGES[name]
+        hashes = []
+        stack = []
+        for obj in [stage['func'], *stage.get('code', [])]:
+            module = inspect.getmodule(obj)
+            if module is sys.modules[__name__]:
+                hashes.append([obj.__name__, inspect.getsource(obj)])
+            else:
+                stack.append(module)
+        # Follow the imports of the library modules, keeping those defined in this folder
+        cache = DataCache()
+        seen = set()
+        while stack:
+            module = stack.pop()
+            path = getattr(module, '__file__', None)
+            if module is None or path is None or module.__name__ in seen or module is sys.modules[__name__] \
+                    or os.path.dirname(os.path.abspath(path)) != PANEL_DIR:
+                continue
+            seen.add(module.__name__)
+            hashes.append([module.__name__, cache._content_hash(path)])
+            for value in vars(module).values():
+                if inspect.ismodule(value):
+                    stack.append(value)
+                elif inspect.isclass(value) or inspect.isfunction(value):
+                    stack.append(inspect.getmodule(value))
+        return sorted(hashes)
+
+    def _stage_key(self, name, keys):
+        """
+        Hashes everything a stage's result depends on: its parameters, the keys of its upstream stages,
+        the contents of its input files and the code it runs (see _code_hashes).
+
+        name: stage name
+        keys: keys of the stages computed so far
+        """
+        stage = STAGES[name]
+        payload = {
+            'stage': name,
+            'params': {param: self.params[param] for param in stage['params']},
+            'deps': [keys[dep] for dep in stage['deps']],
+            'inputs': self._input_hashes(name),
+            'code': self._code_hashes(name)
+        }
+        return hashlib.sha256(json.dumps(payload, sort_keys=True, default=str).encode('utf-8')).hexdigest()
+
+    def _result_path(self, name):
+        """
+        Returns the path of a stage's memoized result.
+        """
+        return os.path.join(self.cache_dir, f"{name}.pkl")
+
+    def _order(self):
+        """
+        Returns the stage names in topological order.
+        """
+        order = []
+        def visit(name):
+            if name not in order:
+                for dep in STAGES[name]['deps']:
+                    visit(dep)
+                order.append(name)
+        for name in STAGES:
+            visit(name)
+        return order
+
+    def _call(self, name, results):
+        """
+        Returns the function, positional arguments and keyword arguments of a stage.
+        Stages that build processors, analyzers or maps also receive the tracer.
+        """
+        stage = STAGES[name]
+        rename = stage.get('rename', {})
+        kwargs = {rename.get(param, param): self.params[param] for param in stage['params']}
+        if self.tracer.enabled and 'tracer' in inspect.signature(stage['func']).parameters:
+            kwargs['tracer'] = self.tracer
+        return stage['func'], [results[dep] for dep in stage['deps']], kwargs
+
+    def _run(self):
+        """
+        Runs the stale stages and returns the names of the stages that were executed.
+        A stage is stale when its key differs from the memoized one, or its memoized result or one of its output files is missing.
+        """
+        # Step 1: Compute every stage key and load the memoized results of fresh stages
+        manifest = {}
+        if os.path.exists(self.manifest_path):
+            with open(self.manifest_path, encoding='utf-8') as f:
+                manifest = json.load(f)
+        keys, results, stale = {}, {}, []
+        for name in self._order():
+            keys[name] = self._stage_key(name, keys)
+            outputs = STAGES[name].get('outputs', lambda p: [])(self.params)
+            if manifest.get(name) == keys[name] and os.path.exists(self._result_path(name)) \
+                    and all(os.path.exists(path) for path in outputs):
+                with open(self._result_path(name), 'rb') as f:
+                    results[name] = pickle.load(f)
+            else:
+                stale.append(name)
+
+        # Step 2: Run stale stages as soon as their upstream stages are done
+        os.makedirs(self.cache_dir, exist_ok=True)
+        def finish(name, result):
+            results[name] = result
+            with open(self._result_path(name), 'wb') as f:
+                pickle.dump(result, f)
+            manifest[name] = keys[name]
+            with open(self.manifest_path, 'w', encoding='utf-8') as f:
+                json.dump(manifest, f, indent=1)
+            print(f"Stage {name} done")
+
+        pending = list(stale)
+        if self.n_jobs > 1:
+            with ProcessPoolExecutor(max_workers=self.n_jobs) as pool:
+                running = {}
+                while pending or running:
+                    for name in [n for n in pending if all(dep in results for dep in STAGES[n]['deps'])]:
+                        pending.remove(name)
+                        running[pool.submit(_run_stage, name, self.tracer, *self._call(name, results))] = name
+                    done, _ = wait(running, return_when=FIRST_COMPLETED)
+                    for future in done:
+                        result, spans = future.result()
+                        self.tracer._attach(spans)
+                        finish(running.pop(future), result)
+        else:
+            for name in pending:
+                func, args, kwargs = self._call(name, results)
+                with self.tracer._span(name, stage=True):
+                    result = func(*args, **kwargs)
+                finish(name, result)
+
+        for name in self._order():
+            if name not in stale:
+                print(f"Stage {name} up to date")
+        return stale
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run the stages of main.py, re-running only those whose inputs changed.")
+    parser.add_argument('--start', type=int, default=DEFAULT_PARAMS['start'], help="first academic year of the panel")
+    parser.add_argument('--end', type=int, default=DEFAULT_PARAMS['end'], help="last academic year of the panel")
+    parser.add_argument('--unbalanced', action='store_true', help="keep institutions not observed in every year")
+    parser.add_argument('--excluding-states', nargs='*', default=DEFAULT_PARAMS['excluding_states'],
+                        help="state abbreviations to exclude")
+    parser.add_argument('--all-institutions', action='store_true',
+                        help="keep institutions that do not offer a bachelor's degree")
+    parser.add_argument('--year', type=int, default=DEFAULT_PARAMS['year'], help="academic year to analyze")
+    parser.add_argument('--formula', type=float, nargs=2, default=DEFAULT_PARAMS['formula'], metavar=('A', 'B'),
+                        help="linear and quadratic coefficients of the simulation formula")
+    parser.add_argument('--compare-states', nargs='+', default=DEFAULT_PARAMS['compare_states'],
+                        help="states compared in the bar chart")
+    parser.add_argument('--n-jobs', type=int, default=1, help="worker processes for independent stages")
+    parser.add_argument('--trace', default=None, metavar='PATH',
+                        help="record the time, memory and rows in/out of every stage and step to this file")
+    parser.add_argument('--trace-format', choices=TRACE_FORMATS, default='jsonl',
+                        help="JSON lines, or a Chrome trace for chrome://tracing and Perfetto")
+    parser.add_argument('--profile', nargs='+', default=None, metavar='SPAN',
+                        help="span names to run under cProfile, e.g. data_loader simulate (dumps go to Cache/profile)")
+    args = parser.parse_args()
+
+    params = {
+        'start': args.start,
+        'end': args.end,
+        'balanced_panel': not args.unbalanced,
+        'excluding_states': args.excluding_states,
+        'undergraduate_institutions': not args.all_institutions,
+        'year': args.year,
+        'formula': args.formula,
+        'compare_states': args.compare_states
+    }
+    tracer = Tracer(args.trace, args.trace_format, profile=args.profile)
+    Pipeline(params, n_jobs=args.n_jobs, tracer=tracer)._run()
+    if tracer.enabled:
+        print(tracer._summary().to_string())
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,142 @@
+import os
+import numpy as np
+import pandas as pd
+import matplotlib.pyplot as plt
+from matplotlib.table import Table
+from concurrent.futures import ProcessPoolExecutor
+from MapMaker import FILE_FORMATS
+from Tracer import Tracer, traced
+
+def _report_chunk(batch):
+    """
+    Renders one ReportBatch in a worker process with the non-interactive Agg backend.
+    Returns the (LaTeX code, figure path) of each job and the spans the worker recorded.
+    """
+    plt.switch_backend('Agg')
+    return batch._render(), batch.tracer._detach()
+
+class ReportBatch():
+    def __init__(self, jobs, n_jobs=1, file_format='png', output_dir=None, label='tab:desc_region_stats', tracer=None):
+        """
+        jobs: list of (desc_stats, region_stats, title, caption, file_name) tuples, each describing one table:
+        the two results of DataAnalyzer._summary_statistics, the figure title, the LaTeX caption and the figure file name
+        n_jobs: number of worker processes the jobs are spread across (1 renders them in this process)
+        file_format: 'png' (300 dpi raster), or 'svg' / 'pdf' for vector output
+        output_dir: folder the table figures are saved to (None for the Figure folder of the working directory)
+        label: LaTeX label of the tables, or a list with one label per job
+        tracer: Tracer recording the time and memory of the templates and of each table (None for no tracing)
+        """
+        if file_format not in FILE_FORMATS:
+            raise ValueError(f"file_format must be one of {FILE_FORMATS}.")
+        self.jobs = list(jobs)
+        self.n_jobs = n_jobs
+        self.file_format = file_format
+        self.output_dir = output_dir
+        self.labels = [label] * len(self.jobs) if isinstance(label, str) else list(label)
+        if len(self.labels) != len(self.jobs):
+            raise ValueError("label must be a string or a list with one label per job.")
+        self.tracer = tracer or Tracer()
+
+    def _long_table(self, desc_stats, region_stats):
+        """
+        Reshapes descriptive and regional statistics into one (Variable, Value) table: the descriptive statistics first,
+        then the mean and variance of each region.
+        """
+        desc_long = pd.DataFrame({'Variable': desc_stats.columns, 'Value': desc_stats.iloc[0].to_numpy()})
+        regions = region_stats['census_region'].astype(str).to_numpy()
+        region_long = pd.DataFrame({
+            'Variable': np.column_stack([regions + ' Mean', regions + ' Variance']).ravel(),
+            'Value': region_stats[['mean', 'var']].to_numpy(dtype='float64').ravel()
+        })
+        return pd.concat([desc_long, region_long], ignore_index=True)
+
+    @traced('report_template', attrs=lambda self, n_rows, title: {'rows': n_rows})
+    def _template(self, n_rows, title):
+        """
+        Builds a table figure with a header and n_rows rows of empty cells once; _draw fills in the texts for each job.
+        The cells have fixed positions, so the tight crop is measured here once (with the longest title of the jobs) and the
+        figure is resized to it: each job is then saved with a single draw, without the dry run of bbox_inches='tight'.
+        """
+        # Step 1: Lay out the title and the cells
+        fig, ax = plt.subplots(figsize=(6, max(4, 0.3 * n_rows)))
+        ax.axis('off')
+        title = ax.set_title(title, fontsize=14, fontweight='bold')
+        tbl = Table(ax, bbox=[0, 0, 1, 1])
+        columns = ['Variable', 'Value']
+        cell_w = 1.0 / len(columns)
+        cell_h = 1.0 / (n_rows + 1)
+        for j, colname in enumerate(columns):
+            tbl.add_cell(0, j, cell_w, cell_h, text=colname, loc='center', facecolor='#CCCCCC')
+        cells = [[tbl.add_cell(i + 1, j, cell_w, cell_h, text='', loc='center', facecolor='white') for j in range(len(columns))]
+                 for i in range(n_rows)]
+        ax.add_table(tbl)
+        fig.tight_layout()
+
+        # Step 2: Measure the tight bounding box at 300 dpi, then crop the figure to it by moving the axes and resizing
+        dpi = fig.get_dpi()
+        fig.set_dpi(300)
+        bbox = fig.get_tightbbox(fig.canvas.get_renderer()).padded(plt.rcParams['savefig.pad_inches'])
+        fig.set_dpi(dpi)
+        width, height = fig.get_size_inches()
+        x0, y0, w, h = ax.get_position().bounds
+        ax.set_position([(x0 * width - bbox.x0) / bbox.width, (y0 * height - bbox.y0) / bbox.height,
+                         w * width / bbox.width, h * height / bbox.height])
+        fig.set_size_inches(bbox.width, bbox.height)
+        return {'fig': fig, 'title': title, 'table': tbl, 'cells': cells, 'fontsize': tbl.FONTSIZE}
+
+    @traced('report_draw', attrs=lambda self, template, table, title, file_name: {'file_name': file_name})
+    def _draw(self, template, table, title, file_name):
+        """
+        Writes one table into the template (title and cell texts) and saves it.
+        """
+        # Step 1: Fill in the cells; floats are shown with 3 decimals
+        for row, values in zip(template['cells'], table.itertuples(index=False)):
+            for cell, val in zip(row, values):
+                cell.get_text().set_text(f"{val:.3f}" if isinstance(val, float) else str(val))
+        template['title'].set_text(title)
+
+        # Step 2: The table shrinks its font to fit the longest text when drawn, so start each job from the initial size
+        for cell in template['table'].get_celld().values():
+            cell.set_fontsize(template['fontsize'])
+
+        # Step 3: Save at 300 dpi; the figure is already cropped by _template
+        output_dir = self.output_dir or os.path.join(os.getcwd(), 'Figure')
+        fig_path = os.path.join(output_dir, f'{file_name}.{self.file_format}')
+        template['fig'].savefig(fig_path, dpi=300)
+        return fig_path
+
+    def _render(self):
+        """
+        Renders every job and returns its (LaTeX code, figure path), in job order.
+        Jobs with the same number of rows share one template figure; with n_jobs > 1 the jobs are split into
+        contiguous chunks, each rendered by a worker process on its own templates.
+        """
+        if self.n_jobs > 1 and len(self.jobs) > 1:
+            n_chunks = min(self.n_jobs, len(self.jobs))
+            bounds = np.linspace(0, len(self.jobs), n_chunks + 1).astype(int)
+            chunks = [ReportBatch(self.jobs[lo:hi], 1, self.file_format, self.output_dir, self.labels[lo:hi], self.tracer)
+                      for lo, hi in zip(bounds[:-1], bounds[1:])]
+            with ProcessPoolExecutor(max_workers=n_chunks) as pool:
+                rendered = []
+                for reports, spans in pool.map(_report_chunk, chunks):
+                    self.tracer._attach(spans)
+                    rendered.extend(reports)
+                return rendered
+
+        # Jobs with the same number of rows share a template, cropped for the longest of their titles
+        tables = [self._long_table(desc_stats, region_stats) for desc_stats, region_stats, *_ in self.jobs]
+        titles = {}
+        for table, (_, _, title, _, _) in zip(tables, self.jobs):
+            titles[len(table)] = max(titles.get(len(table), ''), title, key=len)
+        templates = {}
+        rendered = []
+        try:
+            for table, (_, _, title, caption, file_name), label in zip(tables, self.jobs, self.labels):
+                latex_code = table.to_latex(index=False, caption=caption, label=label, float_format="%.3f")
+                if len(table) not in templates:
+                    templates[len(table)] = self._template(len(table), titles[len(table)])
+                rendered.append((latex_code, self._draw(templates[len(table)], table, title, file_name)))
+            return rendered
+        finally:
+            for template in templates.values():
+                plt.close(template['fig'])
@@ -0,0 +1,176 @@
+import copy
+import numpy as np
+import pandas as pd
+
+# Census divisions and their regions. DC and the territories are not assigned to a region or division,
+# as in the regional statistics of earlier versions; they still count towards the national level.
+CENSUS_DIVISIONS = {
+    'New England': ('Northeast', ['ME', 'NH', 'VT', 'MA', 'RI', 'CT']),
+    'Middle Atlantic': ('Northeast', ['NY', 'NJ', 'PA']),
+    'East North Central': ('Midwest', ['OH', 'IN', 'IL', 'MI', 'WI']),
+    'West North Central': ('Midwest', ['MN', 'IA', 'MO', 'ND', 'SD', 'NE', 'KS']),
+    'South Atlantic': ('South', ['DE', 'MD', 'VA', 'WV', 'NC', 'SC', 'GA', 'FL']),
+    'East South Central': ('South', ['KY', 'TN', 'MS', 'AL']),
+    'West South Central': ('South', ['OK', 'TX', 'AR', 'LA']),
+    'Mountain': ('West', ['MT', 'ID', 'WY', 'CO', 'NM', 'AZ', 'UT', 'NV']),
+    'Pacific': ('West', ['WA', 'OR', 'CA', 'AK', 'HI'])
+}
+STATE_DIVISION = {state: division for division, (_, states) in CENSUS_DIVISIONS.items() for state in states}
+STATE_REGION = {state: region for region, states in CENSUS_DIVISIONS.values() for state in states}
+ROLLUP_LEVELS = ('national', 'region', 'division', 'state')
+NATIONAL = 'United States'
+# Statistics of each group, in the order of DataFrame.describe plus the variance
+STATISTICS = ['count', 'mean', 'std', 'min', '25%', '50%', '75%', 'max', 'variance']
+
+
+def _compress(values, weights, size):
+    """
+    Compresses a weighted sample into at most size centroids of about equal weight (a merging quantile sketch).
+    Samples of at most size points are kept as they are, so their quantiles stay exact.
+    """
+    if len(values) <= size:
+        return values, weights
+    order = np.argsort(values, kind='stable')
+    values, weights = values[order], weights[order]
+    cum = np.cumsum(weights)
+    bins = np.minimum(((cum - weights / 2) / cum[-1] * size).astype(np.int64), size - 1)
+    total = np.bincount(bins, weights, minlength=size)
+    used = total > 0
+    return (np.bincount(bins, weights * values, minlength=size)[used] / total[used]), total[used]
+
+
+def _quantiles(values, weights, qs, lo, hi):
+    """
+    Returns quantiles of a sketch with linear interpolation, as pandas does. Uncompressed samples give exact quantiles;
+    compressed ones are interpolated between centroids placed at the middle of their weight, bounded by the exact min and max.
+    """
+    if not len(values):
+        return np.full(len(qs), np.nan)
+    if np.all(weights == 1):
+        return np.quantile(values, qs)
+    order = np.argsort(values, kind='stable')
+    values, weights = values[order], weights[order]
+    positions = np.cumsum(weights) - weights / 2 - 0.5
+    n = weights.sum()
+    return np.interp(np.asarray(qs) * (n - 1), np.concatenate([[0], positions, [n - 1]]),
+                     np.concatenate([[lo], values, [hi]]))
+
+
+class Rollup():
+    def __init__(self, data, cols, sketch_size=256):
+        """
+        Accumulates mergeable statistics of each column by state in one vectorized pass: count, shifted sum and
+        sum of squares (shifted by a reference value, which keeps the variance accurate), min, max and a quantile sketch.
+        Region, division and national statistics are derived from the state accumulators without rescanning the data,
+        and accumulators of several years can be merged with _merge.
+
+        data: a DataFrame with 'stabbr' and the columns to summarize (rows with missing values are skipped per column)
+        cols: list of columns to summarize
+        sketch_size: number of centroids kept per state and column; up to this many values per state, quantiles are exact
+        """
+        self.cols = list(cols)
+        self.sketch_size = sketch_size
+        self.states, codes = np.unique(data['stabbr'].astype(str).to_numpy(), return_inverse=True)
+        n_states, n_cols = len(self.states), len(self.cols)
+        self.count = np.zeros((n_states, n_cols))
+        self.shift = np.zeros(n_cols)
+        self.sum = np.zeros((n_states, n_cols))
+        self.sum_sq = np.zeros((n_states, n_cols))
+        self.min = np.full((n_states, n_cols), np.nan)
+        self.max = np.full((n_states, n_cols), np.nan)
+        self.sketches = [[None] * n_cols for _ in range(n_states)]
+
+        for j, col in enumerate(self.cols):
+            # Step 1: Moments of the non-missing values, shifted by the first value
+            x = data[col].to_numpy(dtype='float64', na_value=np.nan)
+            valid = ~np.isnan(x)
+            x, state = x[valid], codes[valid]
+            self.shift[j] = x[0] if len(x) else 0.0
+            d = x - self.shift[j]
+            self.count[:, j] = np.bincount(state, minlength=n_states)
+            self.sum[:, j] = np.bincount(state, d, minlength=n_states)
+            self.sum_sq[:, j] = np.bincount(state, d * d, minlength=n_states)
+
+            # Step 2: Sort the values by state once; min, max and sketches come from each state's segment
+            order = np.lexsort((x, state))
+            x, state = x[order], state[order]
+            bounds = np.searchsorted(state, np.arange(n_states + 1))
+            for s in range(n_states):
+                segment = x[bounds[s]:bounds[s + 1]]
+                if len(segment):
+                    self.min[s, j], self.max[s, j] = segment[0], segment[-1]
+                self.sketches[s][j] = _compress(segment, np.ones(len(segment)), sketch_size)
+
+    def _merge(self, other):
+        """
+        Returns the accumulators of the union of two samples, e.g. two years of the same columns, without rescanning either.
+
+        other: Rollup of the same columns
+        """
+        if other.cols != self.cols:
+            raise ValueError("Only rollups of the same columns can be merged.")
+        merged = copy.copy(self)
+        merged.states = np.union1d(self.states, other.states)
+        n_states, n_cols = len(merged.states), len(self.cols)
+        merged.count = np.zeros((n_states, n_cols))
+        merged.sum = np.zeros((n_states, n_cols))
+        merged.sum_sq = np.zeros((n_states, n_cols))
+        merged.min = np.full((n_states, n_cols), np.nan)
+        merged.max = np.full((n_states, n_cols), np.nan)
+        merged.sketches = [[(np.empty(0), np.empty(0))] * n_cols for _ in range(n_states)]
+
+        for part in [self, other]:
+            rows = np.searchsorted(merged.states, part.states)
+            # Re-express the part's sums around the merged shift: sum(x - c) = sum(x - c') + n (c' - c)
+            delta = part.shift - merged.shift
+            merged.count[rows] += part.count
+            merged.sum[rows] += part.sum + part.count * delta
+            merged.sum_sq[rows] += part.sum_sq + 2 * delta * part.sum + part.count * delta ** 2
+            merged.min[rows] = np.fmin(merged.min[rows], part.min)
+            merged.max[rows] = np.fmax(merged.max[rows], part.max)
+            for s, row in enumerate(rows):
+                for j in range(n_cols):
+                    values = np.concatenate([merged.sketches[row][j][0], part.sketches[s][j][0]])
+                    weights = np.concatenate([merged.sketches[row][j][1], part.sketches[s][j][1]])
+                    merged.sketches[row][j] = _compress(values, weights, self.sketch_size)
+        return merged
+
+    def _group_keys(self, level):
+        """
+        Returns the group of each state at a level (None for states outside every group of that level).
+        """
+        if level not in ROLLUP_LEVELS:
+            raise ValueError(f"level must be one of {ROLLUP_LEVELS}.")
+        if level == 'national':
+            return [NATIONAL] * len(self.states)
+        if level == 'state':
+            return list(self.states)
+        mapping = STATE_REGION if level == 'region' else STATE_DIVISION
+        return [mapping.get(state) for state in self.states]
+
+    def _table(self, levels=ROLLUP_LEVELS):
+        """
+        Returns the statistics of every group of every level and column, in the style of grouping sets:
+        one row per (level, group, column) with count, mean, std, min, quartiles, max and variance (groups sorted by name).
+
+        levels: levels to include, among 'national', 'region', 'division' and 'state'
+        """
+        rows = []
+        for level in levels:
+            keys = self._group_keys(level)
+            groups = sorted({key for key in keys if key is not None})
+            members = {group: [s for s, key in enumerate(keys) if key == group] for group in groups}
+            for j, col in enumerate(self.cols):
+                for group in groups:
+                    states = members[group]
+                    n = self.count[states, j].sum()
+                    total = self.sum[states, j].sum()
+                    total_sq = self.sum_sq[states, j].sum()
+                    lo, hi = np.nanmin(self.min[states, j], initial=np.inf), np.nanmax(self.max[states, j], initial=-np.inf)
+                    values = np.concatenate([self.sketches[s][j][0] for s in states])
+                    weights = np.concatenate([self.sketches[s][j][1] for s in states])
+                    variance = max(total_sq - total * total / n, 0.0) / (n - 1) if n > 1 else np.nan
+                    quartiles = _quantiles(values, weights, [0.25, 0.5, 0.75], lo, hi)
+                    rows.append([level, group, col, n, self.shift[j] + total / n if n else np.nan, np.sqrt(variance),
+                                 lo if n else np.nan, *quartiles, hi if n else np.nan, variance])
+        return pd.DataFrame(rows, columns=['level', 'group', 'column'] + STATISTICS)
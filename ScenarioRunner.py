@@ -0,0 +1,172 @@
+"""
+Sensitivity analyses: runs the flow of main.py for many configurations from one loaded raw panel.
+
+The raw panel is loaded once for the widest year range of all scenarios; each scenario's clean panel is a year slice of it
+cleaned with the scenario's criteria, and the analyses, tables and maps of the scenarios run in parallel, each into its own folder.
+
+Usage (from the repository root):
+    python ScenarioRunner.py scenarios.json --n-jobs 4
+where scenarios.json is a list of scenarios, each overriding some of Pipeline.DEFAULT_PARAMS, e.g.
+    [{"name": "baseline"},
+     {"name": "unbalanced", "balanced_panel": false},
+     {"name": "2012-2015 all institutions", "start": 2012, "undergraduate_institutions": false}]
+"""
+import os
+import json
+import argparse
+import contextlib
+import numpy as np
+import pandas as pd
+import matplotlib.pyplot as plt
+from concurrent.futures import ProcessPoolExecutor
+import Pipeline
+from DataProcessor import DataProcessor
+from MapMaker import MapMaker
+from Tracer import Tracer, TRACE_FORMATS
+
+# Parameters that define the clean panel of a scenario
+PANEL_PARAMS = ['start', 'end', 'balanced_panel', 'excluding_states', 'undergraduate_institutions']
+
+
+def _run_scenario(clean_data, scenario, scenario_dir, tracer):
+    """
+    Runs regions 1 (export) to 4 of main.py for one scenario on its clean panel, writing every output into scenario_dir.
+    The console output (export paths and LaTeX code) goes to scenario_dir/log.txt. Returns the spans the run recorded.
+
+    clean_data: clean panel of the scenario
+    scenario: full parameters of the scenario (see Pipeline.DEFAULT_PARAMS)
+    scenario_dir: output folder of the scenario
+    tracer: Tracer recording the steps of the scenario
+    """
+    plt.switch_backend('Agg')
+    fig_dir = os.path.join(scenario_dir, 'Figure')
+    os.makedirs(fig_dir, exist_ok=True)
+    year = scenario['year']
+    with open(os.path.join(scenario_dir, 'log.txt'), 'w', encoding='utf-8') as log, contextlib.redirect_stdout(log), \
+            tracer._span('scenario', rows_in=clean_data, scenario=scenario['name']):
+        # Region 1: Export the clean panel
+        processor = DataProcessor(*[scenario[key] for key in PANEL_PARAMS], tracer=tracer)
+        processor._data_exporter(clean_data, binary=True, output_dir=scenario_dir)
+        clean_path = os.path.join(scenario_dir, 'clean_data')
+
+        # Regions 2 and 3: Enrollment trend, state comparison, actual and simulated summary tables
+        Pipeline.enrollment_trend(clean_path, output_dir=fig_dir)
+        state_data = Pipeline.state_grants(clean_path, year, tracer=tracer)
+        Pipeline.compare_states(state_data, year, scenario['compare_states'], output_dir=fig_dir)
+        Pipeline.grant_summary_table(state_data, year, tracer=tracer, output_dir=fig_dir)
+        simulated_data = Pipeline.simulate(clean_path, year, scenario['formula'], tracer=tracer)
+        Pipeline.simulated_summary_table(simulated_data, year, tracer=tracer, output_dir=fig_dir)
+
+        # Region 4: Maps
+        Pipeline.grant_map(state_data, year, tracer=tracer, output_dir=fig_dir)
+        Pipeline.simulated_map(simulated_data, year, tracer=tracer, output_dir=fig_dir)
+    return tracer._detach()
+
+
+class ScenarioRunner():
+    def __init__(self, scenarios, output_dir='Scenarios', n_jobs=1, tracer=None):
+        """
+        scenarios: list of dicts, each overriding some of Pipeline.DEFAULT_PARAMS; 'name' names the scenario's output folder
+        (by default scenario_01, scenario_02, ...)
+        output_dir: folder holding one subfolder per scenario
+        n_jobs: number of worker processes the scenarios are spread across (1 runs them in this process)
+        tracer: Tracer recording the loading, the cleaning of each scenario and each scenario's steps (None for no tracing)
+        """
+        self.scenarios = []
+        for i, overrides in enumerate(scenarios):
+            unknown = set(overrides) - set(Pipeline.DEFAULT_PARAMS) - {'name'}
+            if unknown:
+                raise ValueError(f"Unknown scenario parameters: {sorted(unknown)}.")
+            self.scenarios.append({'name': f"scenario_{i + 1:02d}", **Pipeline.DEFAULT_PARAMS, **overrides})
+        names = [scenario['name'] for scenario in self.scenarios]
+        if len(set(names)) != len(names):
+            raise ValueError("Scenario names must be unique.")
+        self.output_dir = output_dir
+        self.n_jobs = n_jobs
+        self.tracer = tracer or Tracer()
+
+    def _raw_panel(self):
+        """
+        Loads the raw panel once for the widest year range of all scenarios, without any cleaning criteria.
+        """
+        start = min(scenario['start'] for scenario in self.scenarios)
+        end = max(scenario['end'] for scenario in self.scenarios)
+        return DataProcessor(start, end, False, [], False, n_jobs=self.n_jobs, tracer=self.tracer)._data_loader()
+
+    def _clean_panel(self, raw_data, scenario):
+        """
+        Derives the clean panel of a scenario from the raw panel: the rows of its years are a contiguous slice
+        (the raw panel is in year order), cleaned with the scenario's criteria as DataProcessor._data_cleaner does.
+        The result is the same as loading and cleaning the scenario's years on their own.
+        """
+        years = raw_data['year'].to_numpy()
+        lo, hi = np.searchsorted(years, [scenario['start'], scenario['end'] + 1])
+        processor = DataProcessor(*[scenario[key] for key in PANEL_PARAMS], tracer=self.tracer)
+        return processor._data_cleaner(raw_data.iloc[lo:hi])
+
+    def _run(self):
+        """
+        Runs every scenario and returns one row per scenario with its parameters, panel size and output folder.
+        Clean panels are derived as the scenarios are submitted, with at most two per worker waiting, so memory holds
+        the raw panel and a few clean panels however many scenarios there are.
+        """
+        # Step 1: Load the raw panel once
+        raw_data = self._raw_panel()
+
+        # Step 2: Write the parameters of each scenario into its folder
+        scenario_dirs = [os.path.join(self.output_dir, scenario['name']) for scenario in self.scenarios]
+        for scenario, scenario_dir in zip(self.scenarios, scenario_dirs):
+            os.makedirs(scenario_dir, exist_ok=True)
+            with open(os.path.join(scenario_dir, 'scenario.json'), 'w', encoding='utf-8') as f:
+                json.dump(scenario, f, indent=1)
+
+        # Step 3: Derive each scenario's clean panel and run its analyses, serially or in a process pool
+        rows = []
+        def tasks():
+            for scenario, scenario_dir in zip(self.scenarios, scenario_dirs):
+                clean_data = self._clean_panel(raw_data, scenario)
+                rows.append({**scenario, 'rows': len(clean_data), 'institutions': clean_data['ID_IPEDS'].nunique(),
+                             'output_dir': scenario_dir})
+                yield clean_data, scenario, scenario_dir, self.tracer
+
+        if self.n_jobs > 1 and len(self.scenarios) > 1:
+            # Build the base layer before forking, so workers find it in the on-disk cache
+            MapMaker(None, None, None)._base_layer()
+            n_workers = min(self.n_jobs, len(self.scenarios))
+            with ProcessPoolExecutor(max_workers=n_workers) as pool:
+                pending = []
+                for task in tasks():
+                    pending.append(pool.submit(_run_scenario, *task))
+                    if len(pending) >= 2 * n_workers:
+                        self.tracer._attach(pending.pop(0).result())
+                for future in pending:
+                    self.tracer._attach(future.result())
+        else:
+            for task in tasks():
+                self.tracer._attach(_run_scenario(*task))
+
+        return pd.DataFrame(rows)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run the flow of main.py for many scenarios from one loaded raw panel.")
+    parser.add_argument('scenarios', help="JSON file with a list of scenarios, each overriding some of the default parameters")
+    parser.add_argument('--output-dir', default='Scenarios', help="folder holding one subfolder per scenario")
+    parser.add_argument('--n-jobs', type=int, default=1, help="worker processes the scenarios are spread across")
+    parser.add_argument('--trace', default=None, metavar='PATH',
+                        help="record the time, memory and rows in/out of the loading and of every scenario to this file")
+    parser.add_argument('--trace-format', choices=TRACE_FORMATS, default='jsonl',
+                        help="JSON lines, or a Chrome trace for chrome://tracing and Perfetto")
+    args = parser.parse_args()
+
+    with open(args.scenarios, encoding='utf-8') as f:
+        scenarios = json.load(f)
+    tracer = Tracer(args.trace, args.trace_format)
+    summary = ScenarioRunner(scenarios, args.output_dir, args.n_jobs, tracer)._run()
+    print(summary[['name', 'start', 'end', 'balanced_panel', 'undergraduate_institutions', 'rows', 'institutions']].to_string(index=False))
+    if tracer.enabled:
+        print(tracer._summary().to_string())
+
+
+if __name__ == '__main__':
+    main()
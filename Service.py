@@ -0,0 +1,282 @@
+"""
+Local HTTP/JSON service answering analysis queries from a cleaned panel loaded once.
+
+Usage (from the repository root, after main.py or Pipeline.py has written clean_data):
+    python Service.py --port 8000
+    curl "http://127.0.0.1:8000/grants?year=2015&states=NY,VT"
+    curl "http://127.0.0.1:8000/simulate?year=2015&a=1750&b=0.15"
+    curl "http://127.0.0.1:8000/summary?year=2015&kind=simulated&a=1750&b=0.15"
+    curl -o map.png "http://127.0.0.1:8000/map?year=2015&kind=actual"
+
+Endpoints:
+    /grants    per-student federal grants by state (DataAnalyzer._aggregate_per_student_grant)
+    /simulate  simulated per-student grants by state under formula [a, b] (DataAnalyzer._simulater)
+    /summary   descriptive and regional statistics of actual or simulated grants (DataAnalyzer._summary_statistics)
+    /map       map of actual or simulated grants as PNG or SVG (MapMaker._map_figure)
+    /health    panel size and cache statistics
+Responses are cached by their normalized parameters in an LRU cache bounded in bytes; the X-Cache header tells hits from misses.
+"""
+import os
+import json
+import shutil
+import argparse
+import tempfile
+import threading
+from collections import OrderedDict
+from urllib.parse import urlparse, parse_qs
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import matplotlib
+matplotlib.use('Agg')
+import pandas as pd
+from DataAnalyzer import DataAnalyzer
+from MapMaker import MapMaker
+from PanelFile import PanelFile
+from PanelIndex import PanelIndex
+from Tracer import Tracer
+
+ENDPOINTS = ('/grants', '/simulate', '/summary', '/map')
+GRANT_COLUMNS = {'actual': 'per_student_federal_grant', 'simulated': 'grant_per_student_simulated'}
+
+
+class ResponseCache():
+    def __init__(self, max_bytes):
+        """
+        max_bytes: total size of the cached response bodies; least recently used responses are evicted beyond it
+        """
+        self.max_bytes = max_bytes
+        self.entries = OrderedDict()
+        self.n_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.lock = threading.Lock()
+
+    def _get(self, key):
+        """
+        Returns the cached (content type, body) of a key and marks it as recently used, or None.
+        """
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            self.entries.move_to_end(key)
+            self.hits += 1
+            return entry
+
+    def _put(self, key, content_type, body):
+        """
+        Caches a response body, evicting the least recently used ones until the cache fits in max_bytes.
+        Bodies larger than the whole cache are not cached.
+        """
+        if len(body) > self.max_bytes:
+            return
+        with self.lock:
+            if key in self.entries:
+                self.n_bytes -= len(self.entries.pop(key)[1])
+            self.entries[key] = (content_type, body)
+            self.n_bytes += len(body)
+            while self.n_bytes > self.max_bytes:
+                _, (_, evicted) = self.entries.popitem(last=False)
+                self.n_bytes -= len(evicted)
+
+
+class AnalysisService():
+    def __init__(self, clean_data, cache_bytes=64 * 2**20, tracer=None):
+        """
+        clean_data: cleaned panel (the output of DataProcessor._data_cleaner), indexed once for all queries
+        cache_bytes: memory bound of the response cache, in bytes
+        tracer: Tracer recording the analysis and rendering behind each cache miss (None for no tracing)
+        """
+        self.index = PanelIndex(clean_data)
+        self.tracer = tracer or Tracer()
+        # One analyzer shares its (year, state) cube across all grant queries
+        self.analyzer = DataAnalyzer(self.index, None, None, tracer=self.tracer)
+        self._grant_frames = {}
+        self.cache = ResponseCache(cache_bytes)
+        # DataAnalyzer caches and matplotlib are not thread-safe: analyses and map renders of cache misses run one at a time,
+        # under separate locks so that a slow render does not hold up other queries
+        self.lock = threading.Lock()
+        self.render_lock = threading.Lock()
+        self.output_dir = tempfile.mkdtemp(prefix="ipeds_service_")
+
+    def _params(self, endpoint, query):
+        """
+        Validates and normalizes the query parameters of an endpoint, so that equivalent queries share a cache key.
+        Raises ValueError for missing or malformed parameters.
+
+        endpoint: request path, e.g. '/grants'
+        query: parsed query string, as returned by parse_qs
+        """
+        def value(name, default=None):
+            values = query.get(name)
+            if not values:
+                if default is None:
+                    raise ValueError(f"Missing parameter '{name}'.")
+                return default
+            return values[-1]
+
+        params = {'year': int(value('year'))}
+        if params['year'] not in self.index.years:
+            raise ValueError(f"year must be one of {[int(y) for y in self.index.years]}.")
+        if endpoint in ('/summary', '/map'):
+            params['kind'] = value('kind', 'actual')
+            if params['kind'] not in GRANT_COLUMNS:
+                raise ValueError(f"kind must be one of {list(GRANT_COLUMNS)}.")
+        if endpoint == '/simulate' or params.get('kind') == 'simulated':
+            params['formula'] = [float(value('a')), float(value('b'))]
+        if endpoint in ('/grants', '/simulate'):
+            states = value('states', '')
+            params['states'] = sorted({s.strip().upper() for s in states.split(',') if s.strip()})
+        if endpoint == '/map':
+            params['format'] = value('format', 'png')
+            if params['format'] not in ('png', 'svg'):
+                raise ValueError("format must be 'png' or 'svg'.")
+        return params
+
+    def _grants(self, year):
+        """
+        Returns per-student federal grants by state for a year, computed once per year.
+        """
+        if year not in self._grant_frames:
+            self.analyzer.year = year
+            self._grant_frames[year] = self.analyzer._aggregate_per_student_grant()
+        return self._grant_frames[year]
+
+    def _simulated(self, year, formula):
+        """
+        Returns simulated per-student grants by state for a year and formula.
+        """
+        return DataAnalyzer(self.index, year, formula, tracer=self.tracer)._simulater()
+
+    def _records(self, data):
+        """
+        Converts a DataFrame into a list of JSON records.
+        """
+        return json.loads(data.to_json(orient='records'))
+
+    def _compute(self, endpoint, params):
+        """
+        Computes the response body of an endpoint and returns its content type and bytes.
+        """
+        year = params['year']
+        kind = params.get('kind', 'actual' if endpoint == '/grants' else 'simulated')
+        with self.lock:
+            data = self._grants(year) if kind == 'actual' else self._simulated(year, params['formula'])
+            if endpoint == '/summary':
+                col = GRANT_COLUMNS[kind]
+                desc_stats, region_stats = DataAnalyzer(None, None, None, tracer=self.tracer)._summary_statistics(data, col)
+
+        if endpoint in ('/grants', '/simulate'):
+            if params['states']:
+                data = data[data['stabbr'].astype(str).isin(params['states'])]
+            return 'application/json', json.dumps({'params': params, 'data': self._records(data)}).encode('utf-8')
+
+        if endpoint == '/summary':
+            body = {'params': params, 'descriptive': self._records(desc_stats), 'regions': self._records(region_stats)}
+            return 'application/json', json.dumps(body).encode('utf-8')
+
+        # Maps are rendered into the service's own folder, read back and removed, all under the render lock,
+        # so concurrent misses for the same map never write, read or remove the same file at once
+        export_name = f"{kind} {year}" + (f" {params['formula'][0]:g} {params['formula'][1]:g}" if kind == 'simulated' else '')
+        with self.render_lock:
+            fig_path = MapMaker(data, GRANT_COLUMNS[kind], export_name, file_format=params['format'], tracer=self.tracer,
+                                output_dir=self.output_dir)._map_figure()
+            try:
+                with open(fig_path, 'rb') as f:
+                    body = f.read()
+            finally:
+                os.remove(fig_path)
+        return ('image/png' if params['format'] == 'png' else 'image/svg+xml'), body
+
+    def _respond(self, path, query):
+        """
+        Answers one request. Returns the HTTP status, content type, body and cache state ('hit', 'miss' or None).
+        Invalid parameters give a 400 and errors while computing the response a 500, both with a JSON error message.
+
+        path: request path
+        query: parsed query string, as returned by parse_qs
+        """
+        if path == '/health':
+            body = {'rows': len(self.index), 'years': [int(y) for y in self.index.years],
+                    'cache_entries': len(self.cache.entries), 'cache_bytes': self.cache.n_bytes,
+                    'cache_hits': self.cache.hits, 'cache_misses': self.cache.misses}
+            return 200, 'application/json', json.dumps(body).encode('utf-8'), None
+        if path not in ENDPOINTS:
+            return 404, 'application/json', json.dumps({'error': f"Unknown endpoint {path}."}).encode('utf-8'), None
+        try:
+            params = self._params(path, query)
+        except ValueError as e:
+            return 400, 'application/json', json.dumps({'error': str(e)}).encode('utf-8'), None
+
+        key = json.dumps([path, params], sort_keys=True)
+        cached = self.cache._get(key)
+        if cached is not None:
+            return 200, cached[0], cached[1], 'hit'
+        try:
+            content_type, body = self._compute(path, params)
+        except Exception as e:
+            return 500, 'application/json', json.dumps({'error': f"{type(e).__name__}: {e}"}).encode('utf-8'), None
+        self.cache._put(key, content_type, body)
+        return 200, content_type, body, 'miss'
+
+    def _close(self):
+        """
+        Removes the folder maps are rendered into.
+        """
+        shutil.rmtree(self.output_dir, ignore_errors=True)
+
+
+class ServiceHandler(BaseHTTPRequestHandler):
+    # AnalysisService answering the requests, set on a subclass by _serve
+    service = None
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        status, content_type, body, cache_state = self.service._respond(url.path, parse_qs(url.query))
+        self.send_response(status)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        if cache_state is not None:
+            self.send_header('X-Cache', cache_state)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        # Requests are not logged to keep the console quiet under load
+        pass
+
+
+def _serve(service, host, port):
+    """
+    Serves the service over HTTP, one thread per connection, until interrupted.
+    """
+    handler = type('Handler', (ServiceHandler,), {'service': service})
+    server = ThreadingHTTPServer((host, port), handler)
+    print(f"Serving {len(service.index):,} rows on http://{host}:{port}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        service._close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Serve analysis queries on the cleaned panel over HTTP/JSON.")
+    parser.add_argument('--clean-data', default='clean_data',
+                        help="binary panel folder written by _data_exporter(binary=True), or a clean_data.csv file")
+    parser.add_argument('--host', default='127.0.0.1', help="interface to listen on")
+    parser.add_argument('--port', type=int, default=8000, help="port to listen on")
+    parser.add_argument('--cache-mb', type=float, default=64, help="memory bound of the response cache in MB")
+    args = parser.parse_args()
+
+    if os.path.isdir(args.clean_data):
+        clean_data = PanelFile(args.clean_data)._read()
+    else:
+        clean_data = pd.read_csv(args.clean_data)
+    _serve(AnalysisService(clean_data, cache_bytes=int(args.cache_mb * 2**20)), args.host, args.port)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,225 @@
+import os
+import sys
+import json
+import time
+import cProfile
+import functools
+import contextlib
+import numpy as np
+import pandas as pd
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+TRACE_FORMATS = ('jsonl', 'chrome')
+# ru_maxrss is reported in kilobytes on Linux and in bytes on macOS
+MAXRSS_UNIT = 1 if sys.platform == 'darwin' else 1024
+
+
+def _peak_rss():
+    """
+    Returns the peak resident set size of this process in bytes, or None where it is not available.
+    """
+    if resource is None:
+        return None
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * MAXRSS_UNIT
+
+
+def _row_count(value):
+    """
+    Counts the rows of a stage input or output: the True entries of a boolean mask, the length of a frame, array or
+    other container (e.g. a PanelIndex), or the rows of the first element of a tuple of results. Returns None for anything else.
+    """
+    if isinstance(value, tuple):
+        return _row_count(value[0]) if value else None
+    if isinstance(value, np.ndarray) and value.dtype == bool:
+        return int(value.sum())
+    if isinstance(value, (pd.DataFrame, pd.Series, np.ndarray, list)):
+        return len(value)
+    if isinstance(value, (int, np.integer)):
+        return int(value)
+    if hasattr(value, '__len__') and not isinstance(value, (str, dict)):
+        return len(value)
+    return None
+
+
+def traced(name, rows_in=None, attrs=None):
+    """
+    Decorates a method so that each call is recorded as a span of the instance's tracer (self.tracer).
+    The output row count is taken from the return value; the method runs untouched when tracing is off.
+
+    name: span name
+    rows_in: function of the method's arguments (self included) returning its input, whose rows are counted
+    attrs: function of the method's arguments (self included) returning extra fields of the span, e.g. the year
+    """
+    def decorate(method):
+        @functools.wraps(method)
+        def wrapper(self, *args, **kwargs):
+            tracer = getattr(self, 'tracer', None)
+            if tracer is None or not tracer.enabled:
+                return method(self, *args, **kwargs)
+            fields = attrs(self, *args, **kwargs) if attrs else {}
+            source = rows_in(self, *args, **kwargs) if rows_in else None
+            with tracer._span(name, rows_in=source, **fields) as record:
+                result = method(self, *args, **kwargs)
+                record['rows_out'] = result
+            return result
+        return wrapper
+    return decorate
+
+
+class Tracer():
+    def __init__(self, path=None, trace_format='jsonl', profile=None, profile_dir=os.path.join("Cache", "profile")):
+        """
+        path: file the spans are written to (None turns tracing off, so instrumented code runs with no overhead)
+        trace_format: 'jsonl' appends one JSON object per span as it ends; 'chrome' writes a trace file
+                      that chrome://tracing or Perfetto can open
+        profile: span names to run under cProfile (True profiles every span); each profiled call is dumped to
+                 profile_dir as {name}_{pid}_{n}.prof, readable with pstats or snakeviz
+        profile_dir: folder for the cProfile dumps
+        """
+        if trace_format not in TRACE_FORMATS:
+            raise ValueError(f"trace_format must be one of {TRACE_FORMATS}.")
+        self.path = path
+        self.trace_format = trace_format
+        self.profile = profile if profile is True else set(profile or [])
+        self.profile_dir = profile_dir
+        self.enabled = path is not None or bool(self.profile)
+        self.records = []
+        self._stack = []
+        self._profiler = None
+        self._n_profiles = 0
+        self._owner_pid = os.getpid()
+        if path is not None and os.path.exists(path):
+            os.remove(path)
+
+    def __getstate__(self):
+        """
+        Copies the tracer into a worker process without the spans recorded so far or an active profiler.
+        """
+        state = self.__dict__.copy()
+        state.update(records=[], _stack=[], _profiler=None)
+        return state
+
+    @contextlib.contextmanager
+    def _span(self, name, rows_in=None, **attrs):
+        """
+        Records the wall time, CPU time, growth of the peak RSS and rows in/out of the enclosed block.
+        Yields the span record; the block sets record['rows_out'] to its output (a frame, array, boolean mask or count),
+        which is converted to a row count when the span ends.
+
+        name: span name, e.g. 'data_cleaner'
+        rows_in: input of the block (converted to a row count like rows_out)
+        attrs: extra fields stored with the span
+        """
+        record = {'name': name}
+        if not self.enabled:
+            yield record
+            return
+
+        record.update(attrs)
+        record['rows_in'] = _row_count(rows_in)
+        record['parent'] = self._stack[-1] if self._stack else None
+        record['depth'] = len(self._stack)
+        record['pid'] = os.getpid()
+        profiler = None
+        if self._profiler is None and (self.profile is True or name in self.profile):
+            profiler = self._profiler = cProfile.Profile()
+
+        self._stack.append(name)
+        rss0 = _peak_rss()
+        cpu0 = time.process_time()
+        record['ts'] = time.time()
+        t0 = time.perf_counter()
+        if profiler is not None:
+            profiler.enable()
+        try:
+            yield record
+        finally:
+            if profiler is not None:
+                profiler.disable()
+            record['wall_s'] = time.perf_counter() - t0
+            record['cpu_s'] = time.process_time() - cpu0
+            rss1 = _peak_rss()
+            record['peak_rss_delta_mb'] = (rss1 - rss0) / 2**20 if rss0 is not None else None
+            record['rows_out'] = _row_count(record.get('rows_out'))
+            self._stack.pop()
+            if profiler is not None:
+                self._profiler = None
+                self._dump_profile(name, profiler)
+            self._emit([record])
+
+    def _dump_profile(self, name, profiler):
+        """
+        Writes the statistics of one profiled span.
+        """
+        os.makedirs(self.profile_dir, exist_ok=True)
+        self._n_profiles += 1
+        profiler.dump_stats(os.path.join(self.profile_dir, f"{name}_{os.getpid()}_{self._n_profiles}.prof"))
+
+    def _emit(self, records):
+        """
+        Keeps finished spans and writes them out. Spans recorded in a worker process are only kept, until the
+        parent collects them with _detach and _attach, so that a single process writes the trace file.
+        """
+        self.records.extend(records)
+        if self.path is None or os.getpid() != self._owner_pid:
+            return
+        if self.trace_format == 'jsonl':
+            with open(self.path, 'a', encoding='utf-8') as f:
+                for record in records:
+                    f.write(json.dumps(record, default=str) + "\n")
+        elif not self._stack:
+            # The Chrome trace is one JSON document, rewritten whenever an outermost span ends
+            self._write_chrome()
+
+    def _write_chrome(self):
+        """
+        Atomically writes every span as a complete ('X') event of the Chrome trace event format, in microseconds.
+        """
+        events = []
+        for record in self.records:
+            args = {k: v for k, v in record.items() if k not in ('name', 'pid', 'ts', 'wall_s')}
+            events.append({'name': record['name'], 'ph': 'X', 'pid': record['pid'], 'tid': record['pid'],
+                           'ts': record['ts'] * 1e6, 'dur': record['wall_s'] * 1e6, 'args': args})
+        tmp_path = f"{self.path}.{os.getpid()}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump({'traceEvents': events, 'displayTimeUnit': 'ms'}, f, default=str)
+        os.replace(tmp_path, self.path)
+
+    def _detach(self):
+        """
+        In a worker process, returns and forgets the spans recorded so far, so they can be sent back to the parent;
+        in the process that created the tracer, returns an empty list (its spans are already written).
+        """
+        if os.getpid() == self._owner_pid:
+            return []
+        records, self.records = self.records, []
+        return records
+
+    def _attach(self, records):
+        """
+        Writes out the spans sent back by a worker process (see _detach).
+        """
+        if records:
+            self._emit(records)
+
+    def _summary(self):
+        """
+        Returns the recorded spans aggregated by name: calls, total wall and CPU time, largest RSS growth and rows in/out.
+        """
+        if not self.records:
+            return pd.DataFrame(columns=['calls', 'wall_s', 'cpu_s', 'peak_rss_delta_mb', 'rows_in', 'rows_out'])
+        spans = pd.DataFrame(self.records).reindex(columns=['name', 'wall_s', 'cpu_s', 'peak_rss_delta_mb', 'rows_in', 'rows_out'])
+        # Row counts stay missing for spans that do not count rows, instead of summing to 0
+        total = lambda values: values.sum(min_count=1)
+        return spans.groupby('name', sort=False).agg(
+            calls=('wall_s', 'size'),
+            wall_s=('wall_s', 'sum'),
+            cpu_s=('cpu_s', 'sum'),
+            peak_rss_delta_mb=('peak_rss_delta_mb', 'max'),
+            rows_in=('rows_in', total),
+            rows_out=('rows_out', total)
+        ).sort_values('wall_s', ascending=False)